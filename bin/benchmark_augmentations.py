@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Tool for benchmarking the signal processing of sample augmentations against their former implementations
+"""
+import math
+import timeit
+import argparse
+import resampy
+import numpy as np
+
+from deepspeech_training.util.audio import AUDIO_TYPE_NP, AudioFormat, max_dbfs, normalize_audio, gain_db_to_ratio
+from deepspeech_training.util.sample_collections import LabeledSample
+from deepspeech_training.util.helpers import pick_value_from_range
+from deepspeech_training.util.augmentations import comb_filter, resample, Reverb, Resample
+
+
+def window_loop_comb_filter(audio, n_delay, decay):
+    """Former per-layer implementation of Reverb"""
+    layer = np.copy(audio)
+    for w_index in range(0, math.floor(len(audio) / n_delay)):
+        w1 = w_index * n_delay
+        w2 = (w_index + 1) * n_delay
+        width = min(len(audio) - w2, n_delay)  # last window could be smaller
+        layer[w2:w2 + width] += decay * layer[w1:w1 + width]
+    return layer
+
+
+class FormerReverb(Reverb):
+    """Former implementation of Reverb, applying its comb filters window by window"""
+    def apply(self, sample, clock=0.0):
+        sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
+        audio = np.array(sample.audio, dtype=np.float64)
+        orig_dbfs = max_dbfs(audio)
+        delay = pick_value_from_range(self.delay, clock=clock)
+        decay = gain_db_to_ratio(-pick_value_from_range(self.decay, clock=clock))
+        result = np.copy(audio)
+        primes = [17, 19, 23, 29, 31]
+        for delay_prime in primes:
+            n_delay = math.floor(delay * (delay_prime / primes[0]) * sample.audio_format.rate / 1000.0)
+            result += window_loop_comb_filter(audio, max(16, n_delay), decay)
+        audio = normalize_audio(result, dbfs=orig_dbfs)
+        sample.audio = np.array(audio, dtype=np.float32)
+
+
+class FormerResample(Resample):
+    """Former implementation of Resample, resampling down and back up again with resampy"""
+    def apply(self, sample, clock=0.0):
+        sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
+        rate = pick_value_from_range(self.rate, clock=clock)
+        orig_rate = sample.audio_format.rate
+        audio = resampy.resample(sample.audio, orig_rate, rate, axis=0, filter='kaiser_fast')
+        sample.audio = resampy.resample(audio, rate, orig_rate, axis=0, filter='kaiser_fast')
+
+
+def measure(fn):
+    fn()  # warm-up (filter caches, lazy imports)
+    return min(timeit.repeat(fn, number=1, repeat=CLI_ARGS.repetitions))
+
+
+def report(title, former, current, deviation=None):
+    line = '{:<40} {:>10.2f} ms {:>10.2f} ms {:>8.1f}x'.format(title, former * 1000, current * 1000, former / current)
+    if deviation is not None:
+        line += '   max. deviation {:.2e}'.format(deviation)
+    print(line, flush=True)
+
+
+def apply_augmentation(augmentation, audio, rate):
+    sample = LabeledSample(AUDIO_TYPE_NP, audio.copy(), '', audio_format=AudioFormat(rate, 1, 4),
+                           sample_id='benchmark')
+    augmentation.apply(sample)
+    return sample.audio
+
+
+def compare_augmentations(title, former, current, audio, rate):
+    former_audio = apply_augmentation(former, audio, rate)
+    current_audio = apply_augmentation(current, audio, rate)
+    length = min(len(former_audio), len(current_audio))
+    report(title,
+           measure(lambda: apply_augmentation(former, audio, rate)),
+           measure(lambda: apply_augmentation(current, audio, rate)),
+           deviation=np.max(np.abs(former_audio[:length] - current_audio[:length])))
+
+
+def benchmark_augmentations():
+    rng = np.random.RandomState(CLI_ARGS.seed)
+    rate = CLI_ARGS.rate
+    audio = rng.uniform(-0.5, 0.5, size=(int(CLI_ARGS.duration * rate), 1)).astype(np.float32)
+    print('{:<40} {:>13} {:>13} {:>9}'.format('Benchmark ({} s at {} Hz)'.format(CLI_ARGS.duration, rate),
+                                              'former', 'current', 'speed-up'))
+
+    decay = 10 ** (-10.0 / 20.0)
+    for n_delay in [16, 64, 320, 1600]:
+        former = window_loop_comb_filter(audio, n_delay, decay)
+        current = comb_filter(audio, n_delay, decay)
+        report('comb filter, delay {} samples'.format(n_delay),
+               measure(lambda: window_loop_comb_filter(audio, n_delay, decay)),
+               measure(lambda: comb_filter(audio, n_delay, decay)),
+               deviation=np.max(np.abs(former - current)))
+
+    for delay in [1.0, 20.0]:
+        compare_augmentations('Reverb, delay {} ms'.format(delay),
+                              FormerReverb(delay=delay), Reverb(delay=delay), audio, rate)
+
+    for dst_rate in [8000, 22050, 44100]:
+        if dst_rate == rate:
+            continue
+        former = resampy.resample(audio, rate, dst_rate, axis=0, filter='kaiser_fast')
+        current = resample(audio, rate, dst_rate)
+        report('resample to {} Hz'.format(dst_rate),
+               measure(lambda: resampy.resample(audio, rate, dst_rate, axis=0, filter='kaiser_fast')),
+               measure(lambda: resample(audio, rate, dst_rate)),
+               deviation=np.max(np.abs(former - current)))
+
+    compare_augmentations('Resample, 8000 Hz (round trip)',
+                          FormerResample(rate=8000), Resample(rate=8000), audio, rate)
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description="Tool for benchmarking vectorized sample augmentations against their former implementations"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Duration of the benchmark signal in seconds")
+    parser.add_argument("--rate", type=int, default=16000, help="Sample rate of the benchmark signal")
+    parser.add_argument("--repetitions", type=int, default=10,
+                        help="Number of runs per benchmark - the fastest run gets reported")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the benchmark signal")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    CLI_ARGS = handle_args()
+    benchmark_augmentations()
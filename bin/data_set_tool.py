@@ -18,6 +18,8 @@ from deepspeech_training.util.downloader import SIMPLE_BAR
 from deepspeech_training.util.sample_collections import (
     CSVWriter,
     DirectSDBWriter,
+    ParallelSDBWriter,
+    ShardedSDBWriter,
     TarWriter,
     samples_from_sources,
 )
@@ -38,28 +40,48 @@ def build_data_set():
               'overlay, codec, reverb, resample and volume.')
     extension = Path(CLI_ARGS.target).suffix.lower()
     labeled = not CLI_ARGS.unlabeled
+    if CLI_ARGS.columnar and extension not in ['.sdb', '.sdbs']:
+        print('Option --columnar is only supported for SDB (.sdb) and sharded SDB (.sdbs) targets')
+        sys.exit(1)
     if extension == '.csv':
         writer = CSVWriter(CLI_ARGS.target, absolute_paths=CLI_ARGS.absolute_paths, labeled=labeled)
+    elif extension == '.sdb' and CLI_ARGS.parallel_write:
+        writer = ParallelSDBWriter(CLI_ARGS.target,
+                                   audio_type=audio_type,
+                                   bitrate=CLI_ARGS.bitrate,
+                                   labeled=labeled,
+                                   workers=CLI_ARGS.workers,
+                                   columnar=CLI_ARGS.columnar)
     elif extension == '.sdb':
-        writer = DirectSDBWriter(CLI_ARGS.target, audio_type=audio_type, labeled=labeled)
+        writer = DirectSDBWriter(CLI_ARGS.target, audio_type=audio_type, labeled=labeled, columnar=CLI_ARGS.columnar)
+    elif extension == '.sdbs':
+        writer = ShardedSDBWriter(CLI_ARGS.target,
+                                  num_shards=CLI_ARGS.shards,
+                                  audio_type=audio_type,
+                                  bitrate=CLI_ARGS.bitrate,
+                                  labeled=labeled,
+                                  workers=CLI_ARGS.workers,
+                                  columnar=CLI_ARGS.columnar)
     elif extension == '.tar':
         writer = TarWriter(CLI_ARGS.target, labeled=labeled, gz=False, include=CLI_ARGS.include)
     elif extension == '.tgz' or CLI_ARGS.target.lower().endswith('.tar.gz'):
         writer = TarWriter(CLI_ARGS.target, labeled=labeled, gz=True, include=CLI_ARGS.include)
     else:
-        print('Unknown extension of target file - has to be either .csv, .sdb, .tar, .tar.gz or .tgz')
+        print('Unknown extension of target file - has to be either .csv, .sdb, .sdbs, .tar, .tar.gz or .tgz')
         sys.exit(1)
     with writer:
         samples = samples_from_sources(CLI_ARGS.sources, labeled=not CLI_ARGS.unlabeled)
         num_samples = len(samples)
         if augmentations:
             samples = apply_sample_augmentations(samples, audio_type=AUDIO_TYPE_PCM, augmentations=augmentations)
+        # sharded and parallel writers are encoding samples in their own workers
+        if not isinstance(writer, (ShardedSDBWriter, ParallelSDBWriter)):
+            samples = change_audio_types(samples,
+                                         audio_type=audio_type,
+                                         bitrate=CLI_ARGS.bitrate,
+                                         processes=CLI_ARGS.workers)
         bar = progressbar.ProgressBar(max_value=num_samples, widgets=SIMPLE_BAR)
-        for sample in bar(change_audio_types(
-                samples,
-                audio_type=audio_type,
-                bitrate=CLI_ARGS.bitrate,
-                processes=CLI_ARGS.workers)):
+        for sample in bar(samples):
             writer.add(sample)
 
 
@@ -76,7 +98,7 @@ def handle_args():
     )
     parser.add_argument(
         'target',
-        help='SDB, CSV or TAR(.gz) file to create'
+        help='SDB, sharded SDB manifest (.sdbs), CSV or TAR(.gz) file to create'
     )
     parser.add_argument(
         '--audio-type',
@@ -92,6 +114,24 @@ def handle_args():
     parser.add_argument(
         '--workers', type=int, default=None, help='Number of encoding SDB workers'
     )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Number of SDB shard files to write in case of a sharded SDB target (.sdbs)',
+    )
+    parser.add_argument(
+        '--parallel-write',
+        action='store_true',
+        help='If to let --workers processes encode and write temporary segments in parallel that get stitched '
+        'into the target SDB afterwards (requires additional temporary disk space)',
+    )
+    parser.add_argument(
+        '--columnar',
+        action='store_true',
+        help='If to store the transcripts of an SDB target in separate compressed blocks instead of next to the audio '
+        'data of each sample (only supported for .sdb and .sdbs targets)',
+    )
     parser.add_argument(
         '--unlabeled',
         action='store_true',
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+import tensorflow as tf
+import tensorflow.compat.v1.logging as tflogging
+tflogging.set_verbosity(tflogging.ERROR)
+
+from deepspeech_training.util.augmentations import NormalizeSampleRate, apply_sample_augmentations
+from deepspeech_training.util.config import Config, initialize_globals
+from deepspeech_training.util.feature_store import FeatureStoreWriter, is_feature_store
+from deepspeech_training.util.feeding import feature_config
+from deepspeech_training.util.flags import create_flags, FLAGS
+from deepspeech_training.util.helpers import LimitingPool
+from deepspeech_training.util.logging import log_error, log_info, create_progressbar
+from deepspeech_training.util.mfcc import audio_to_features
+from deepspeech_training.util.sample_collections import samples_from_sources
+
+
+def fail(message, code=1):
+    log_error(message)
+    sys.exit(code)
+
+
+def to_features(sample):
+    features, _ = audio_to_features(sample.audio,
+                                    sample.audio_format.rate,
+                                    Config.audio_window_samples,
+                                    Config.audio_step_samples,
+                                    dct_coefficient_count=Config.n_input,
+                                    upper_frequency_limit=FLAGS.audio_sample_rate / 2)
+    return sample.sample_id, features, sample.transcript
+
+
+def precompute_features(sources, store_dir):
+    samples = samples_from_sources(sources,
+                                   buffering=FLAGS.read_buffer,
+                                   labeled=True,
+                                   memory_map=FLAGS.read_memory_map,
+                                   read_ahead=FLAGS.read_ahead)
+    num_samples = len(samples)
+    # Stored features are used in place of sample-rate normalized audio
+    augmentations = [a for a in Config.augmentations if isinstance(a, NormalizeSampleRate)]
+    samples = apply_sample_augmentations(samples, augmentations, buffering=FLAGS.read_buffer)
+
+    bar = create_progressbar(prefix='Computing features | ', max_value=num_samples).start()
+    # NumPy's FFT and matrix products release the GIL, so features are computed by threads without a TF session
+    with LimitingPool(process_ahead=32, use_threads=True) as pool, \
+            FeatureStoreWriter(store_dir, feature_config(), sources=sources) as writer:
+        for sample_id, features, transcript in pool.imap(to_features, samples):
+            writer.add(sample_id, features, transcript)
+            bar.update(len(writer))
+    bar.finish()
+    log_info('Wrote features of {} samples to "{}"'.format(num_samples, store_dir))
+
+
+def main(_):
+    initialize_globals()
+    if not FLAGS.sources:
+        fail('You have to specify the sample sets to compute features for via the --sources flag.')
+    if not FLAGS.store:
+        fail('You have to specify the feature store directory to create via the --store flag.')
+    if is_feature_store(FLAGS.store):
+        fail('There is already a feature store in "{}"'.format(FLAGS.store))
+    precompute_features(FLAGS.sources.split(','), FLAGS.store)
+
+
+if __name__ == '__main__':
+    create_flags()
+    tf.app.flags.DEFINE_string('sources', '', 'comma separated list of sample sets (CSV, SDB or sharded SDB files) '
+                                              'to compute MFCC features for - they are processed in their usual '
+                                              'order from shortest to longest sample')
+    tf.app.flags.DEFINE_string('store', '', 'directory for writing the feature store to - it can be used in place of '
+                                            'the sample sets via --train_files, --dev_files or --test_files, as long '
+                                            'as the feature configuration (sample rate, window length and step) '
+                                            'matches')
+    tf.app.run(main)
@@ -62,6 +62,7 @@ def main():
         'pyxdg',
         'resampy >= 0.2.2',
         'requests',
+        'scipy',
         'semver',
         'six',
         'sox',
@@ -0,0 +1,156 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+from unittest import mock
+
+import numpy as np
+from deepspeech_training.util.audio import (
+    AUDIO_TYPE_NP,
+    AUDIO_TYPE_OPUS,
+    OPUS_CHUNK_LEN_SIZE,
+    AudioFormat,
+    Sample,
+    decode_opus,
+    mapped_pcm_from_file,
+    get_opus_frame_size,
+    pcm_to_np,
+    read_frames_from_file,
+    read_opus,
+    read_opus_header,
+    unpack_number,
+    vad_split,
+    vad_split_pcm,
+    write_opus,
+)
+
+try:
+    import opuslib
+except Exception:  # pylint: disable=broad-except
+    opuslib = None  # opuslib fails on import, if libopus is not installed
+
+
+def reference_read_opus(encoded):
+    # Chunk by chunk decoding by a fresh opuslib.Decoder (the former read_opus implementation)
+    opus_file = io.BytesIO(encoded)
+    pcm_buffer_size, audio_format = read_opus_header(opus_file)
+    decoder = opuslib.Decoder(audio_format.rate, audio_format.channels)
+    pcm = bytearray()
+    while len(pcm) < pcm_buffer_size:
+        chunk = opus_file.read(unpack_number(opus_file.read(OPUS_CHUNK_LEN_SIZE)))
+        pcm.extend(decoder.decode(chunk, get_opus_frame_size(audio_format.rate)))
+    return audio_format, bytes(pcm[:pcm_buffer_size])
+
+
+def reference_pcm_to_np(pcm, audio_format):
+    # The former pcm_to_np implementation
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    samples = samples.reshape((int(len(samples) / audio_format.channels), audio_format.channels))
+    samples = samples.astype(np.float32) / np.iinfo(np.int16).max
+    return np.expand_dims(np.mean(samples, axis=1), axis=1)
+
+
+class TestVADSplit(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wav_path = os.path.join(self.tmp_dir, 'speech.wav')
+        rng = np.random.RandomState(1)
+        parts = []
+        for _ in range(10):
+            parts.append(np.zeros(rng.randint(1000, 40000), dtype=np.int16))
+            t = np.arange(rng.randint(5000, 80000))
+            parts.append((8000 * np.sin(t * 0.07) * np.sin(t * 0.0013) + rng.normal(0, 2000, len(t))).astype(np.int16))
+        with wave.open(self.wav_path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(16000)
+            wav_file.writeframes(np.concatenate(parts).tobytes())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_mapped_segments(self):
+        for num_padding_frames in [0, 3, 10]:
+            expected = list(vad_split(read_frames_from_file(self.wav_path), num_padding_frames=num_padding_frames))
+            with mapped_pcm_from_file(self.wav_path) as pcm_data:
+                segments = [(bytes(segment), start, end) for segment, start, end in
+                            vad_split_pcm(pcm_data, num_padding_frames=num_padding_frames)]
+            self.assertEqual(segments, expected)
+            if num_padding_frames > 0:
+                self.assertGreater(len(segments), 1)
+
+    def test_outliving_frame(self):
+        with mapped_pcm_from_file(self.wav_path) as pcm_data:
+            segments = vad_split_pcm(pcm_data)
+            frame = segments.gi_frame  # keeps the generator's locals once it finished
+            for segment, _, _ in segments:
+                segment.release()
+        self.assertIsNotNone(frame)
+
+
+@unittest.skipIf(opuslib is None, 'opuslib or libopus not available')
+class TestOpus(unittest.TestCase):
+    def _encode(self, pcm, audio_format, bitrate=None):
+        opus_file = io.BytesIO()
+        write_opus(opus_file, pcm, audio_format=audio_format, bitrate=bitrate)
+        return opus_file.getvalue()
+
+    def test_codec_reuse(self):
+        rng = np.random.RandomState(0)
+        for channels in [1, 2]:
+            audio_format = AudioFormat(16000, channels, 2)
+            pcm = rng.normal(0, 3000, 16100 * channels).astype(np.int16).tobytes()
+            encoded = self._encode(pcm, audio_format)
+            # Cached encoders and decoders must not carry over state or bitrate from former samples
+            self._encode(pcm[::-1], audio_format, bitrate=8000)
+            self.assertEqual(self._encode(pcm, audio_format), encoded)
+            decoded_format, decoded = read_opus(io.BytesIO(encoded))
+            self.assertEqual(decoded_format, audio_format)
+            self.assertEqual(len(decoded), len(pcm))
+            self.assertEqual(reference_read_opus(encoded), (audio_format, decoded))
+            read_opus(io.BytesIO(self._encode(pcm[::-1], audio_format)))
+            self.assertEqual(read_opus(io.BytesIO(encoded))[1], decoded)
+            _, decoded_np = decode_opus(io.BytesIO(encoded))
+            self.assertEqual(decoded_np.tobytes(), decoded)
+
+    def test_foreign_frame_size(self):
+        # Packets of 20 ms instead of write_opus' 60 ms frames
+        audio_format = AudioFormat(16000, 2, 2)
+        pcm = np.random.RandomState(2).normal(0, 3000, 16000 * 2).astype(np.int16).tobytes()
+        encoder = opuslib.Encoder(16000, 2, 'audio')
+        opus_file = io.BytesIO()
+        # Header as written by write_opus: PCM length, rate, channels and width
+        opus_file.write(len(pcm).to_bytes(4, 'big') + (16000).to_bytes(4, 'big') + bytes([2, 2]))
+        for start in range(0, len(pcm), 320 * 4):
+            packet = encoder.encode(pcm[start:start + 320 * 4], 320)
+            opus_file.write(len(packet).to_bytes(OPUS_CHUNK_LEN_SIZE, 'big') + packet)
+        encoded = opus_file.getvalue()
+        _, decoded = read_opus(io.BytesIO(encoded))
+        self.assertEqual(reference_read_opus(encoded), (audio_format, decoded))
+        # Decoders without the expected internals are used through their public API
+        public_decoder = mock.Mock(spec=['decode'], decode=opuslib.Decoder(16000, 2).decode)
+        with mock.patch('deepspeech_training.util.audio.get_opus_codec', return_value=public_decoder):
+            self.assertEqual(read_opus(io.BytesIO(encoded))[1], decoded)
+        with self.assertRaises(ValueError):
+            read_opus(io.BytesIO(encoded[:len(encoded) // 2]))
+
+    def test_decode_to_np(self):
+        rng = np.random.RandomState(1)
+        for channels in [1, 2]:
+            audio_format = AudioFormat(16000, channels, 2)
+            pcm = rng.normal(0, 3000, 8000 * channels).astype(np.int16).tobytes()
+            encoded = self._encode(pcm, audio_format)
+            direct = Sample(AUDIO_TYPE_OPUS, encoded)
+            direct.change_audio_type(AUDIO_TYPE_NP)
+            _, reference_pcm = reference_read_opus(encoded)
+            expected = reference_pcm_to_np(reference_pcm, audio_format)
+            self.assertEqual(direct.audio.shape, (8000, 1))
+            self.assertEqual(direct.audio.dtype, np.float32)
+            self.assertEqual(direct.audio.tobytes(), expected.tobytes())
+            self.assertEqual(pcm_to_np(reference_pcm, audio_format).tobytes(), expected.tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
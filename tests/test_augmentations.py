@@ -0,0 +1,157 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from deepspeech_training.util.audio import AUDIO_TYPE_NP, AUDIO_TYPE_PCM, AUDIO_TYPE_WAV, DEFAULT_FORMAT, AudioFormat
+from deepspeech_training.util.augmentations import (
+    AugmentationPool,
+    Overlay,
+    apply_sample_augmentations,
+    comb_filter,
+    parse_augmentations,
+    resample,
+)
+from deepspeech_training.util.sample_collections import DirectSDBWriter, LabeledSample
+
+
+def create_samples(num_samples):
+    for index in range(num_samples):
+        pcm = (np.arange((index % 5 + 1) * 1600, dtype=np.int16) * (index + 1)).tobytes()
+        yield LabeledSample(AUDIO_TYPE_PCM, pcm, str(index), audio_format=DEFAULT_FORMAT)
+
+
+class TestApplySampleAugmentations(unittest.TestCase):
+    def _augment(self, shared_audio_slot_size=0, augmentations=('volume[dbfs=-25]',), executor='auto'):
+        samples = apply_sample_augmentations(create_samples(20),
+                                             parse_augmentations(augmentations),
+                                             process_ahead=3,
+                                             shared_audio_slot_size=shared_audio_slot_size,
+                                             executor=executor)
+        return [(sample.transcript, np.array(sample.audio)) for sample in samples]
+
+    def _check_equal(self, samples, expected):
+        self.assertEqual(len(samples), len(expected))
+        for (transcript, audio), (expected_transcript, expected_audio) in zip(samples, expected):
+            self.assertEqual(transcript, expected_transcript)
+            np.testing.assert_array_equal(audio, expected_audio)
+
+    def test_shared_audio_ring(self):
+        expected = self._augment()
+        # Samples longer than 4800 values don't fit into a slot and are pickled instead
+        self._check_equal(self._augment(shared_audio_slot_size=4800), expected)
+
+    def test_executors(self):
+        expected = self._augment(augmentations=[], executor='processes')
+        for executor in ['threads', 'auto']:
+            self._check_equal(self._augment(augmentations=[], executor=executor), expected)
+        self._check_equal(self._augment(executor='threads'), self._augment(executor='processes'))
+        augmentations = parse_augmentations(['volume[dbfs=-25]'])
+        # Sample augmentations are not thread-safe and always get applied by processes
+        for executor in ['threads', 'auto', 'processes']:
+            with AugmentationPool(augmentations, process_ahead=3, executor=executor) as pool:
+                self.assertFalse(pool.use_threads)
+        with AugmentationPool([], process_ahead=3, executor='threads') as pool:
+            self.assertTrue(pool.use_threads)
+        # Workers and augmentations only get started on entering the pool
+        pool = AugmentationPool(augmentations, process_ahead=3, executor='processes')
+        self.assertIsNone(pool.pool)
+        pool.close()
+
+    def test_persistent_pool(self):
+        augmented = self._augment()
+        plain = self._augment(augmentations=[])
+        augmentations = parse_augmentations(['volume[dbfs=-25]'])
+        for shared_audio_slot_size in [0, 4800]:
+            with AugmentationPool(augmentations,
+                                  process_ahead=3,
+                                  shared_audio_slot_size=shared_audio_slot_size,
+                                  executor='processes') as pool:
+                for augment, expected in [(True, augmented), (False, plain), (True, augmented)]:
+                    samples = apply_sample_augmentations(create_samples(20),
+                                                         augmentations if augment else None,
+                                                         pool=pool)
+                    self._check_equal([(sample.transcript, np.array(sample.audio)) for sample in samples], expected)
+                # Abandoning an iteration should not affect the following one
+                next(iter(apply_sample_augmentations(create_samples(20), augmentations, pool=pool)))
+                samples = apply_sample_augmentations(create_samples(20), augmentations, pool=pool)
+                self._check_equal([(sample.transcript, np.array(sample.audio)) for sample in samples], augmented)
+                self.assertGreaterEqual(pool.stats()['results'], 80)
+
+
+class TestCombFilter(unittest.TestCase):
+    def test_matches_window_loop(self):
+        audio = np.random.RandomState(0).uniform(-0.5, 0.5, (10007, 1))
+        for n_delay in [16, 29, 127, 128, 583, 10007, 20000]:
+            # Window-by-window recursion of the former Reverb implementation
+            expected = np.copy(audio)
+            for w_index in range(0, math.floor(len(audio) / n_delay)):
+                w1 = w_index * n_delay
+                w2 = (w_index + 1) * n_delay
+                width = min(len(audio) - w2, n_delay)
+                expected[w2:w2 + width] += 0.3 * expected[w1:w1 + width]
+            np.testing.assert_allclose(comb_filter(audio, n_delay, 0.3), expected, rtol=1e-12, atol=1e-12)
+
+
+class TestOverlayBank(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.noise_path = os.path.join(self.tmp_dir, 'noise.sdb')
+        with DirectSDBWriter(self.noise_path, audio_type=AUDIO_TYPE_WAV, labeled=False) as writer:
+            for sample in create_samples(5):
+                writer.add(sample)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_bank(self):
+        overlay = Overlay(self.noise_path, bank='0.5', layers='3')
+        overlay.start()
+        try:
+            self.assertIsNone(overlay.enqueue_process)
+            # Randomly picked samples of 0.3, 0.1 and 0.2 seconds fill the bank - the last one cut to 0.1 seconds
+            self.assertEqual(list(overlay.bank_offsets), [0, 4800, 6400])
+            self.assertEqual(len(overlay.bank), 8000)
+            bank = np.frombuffer(overlay.bank, dtype=np.float32)
+            samples = list(create_samples(5))
+            expected = []
+            for index in [2, 0, 1]:
+                samples[index].change_audio_type(AUDIO_TYPE_NP)
+                expected.append(samples[index].audio.reshape(-1))
+            np.testing.assert_array_equal(bank, np.concatenate(expected)[:8000])
+            wrapped = overlay._bank_slice(20000)
+            self.assertEqual(len(wrapped), 20000)
+            self.assertTrue(any(np.array_equal(wrapped[:8000], np.roll(bank, -offset))
+                                for offset in overlay.bank_offsets))
+            sample = next(create_samples(1))
+            sample.change_audio_type(AUDIO_TYPE_NP)
+            original = np.copy(sample.audio)
+            overlay.apply(sample)
+            self.assertEqual(sample.audio.shape, original.shape)
+            self.assertFalse(np.array_equal(sample.audio, original))
+        finally:
+            overlay.stop()
+
+
+def sine(frequency, rate, seconds=1.0):
+    return np.sin(2 * np.pi * frequency * np.arange(int(rate * seconds)) / rate).astype(np.float32)[:, np.newaxis]
+
+
+class TestResampling(unittest.TestCase):
+    def test_resample(self):
+        for src_rate, dst_rate in [(48000, 16000), (8000, 16000), (44100, 16000), (16000, 16001)]:
+            resampled = resample(sine(440, src_rate), src_rate, dst_rate)
+            self.assertEqual(resampled.shape, (dst_rate, 1))
+            self.assertEqual(resampled.dtype, np.float32)
+            # Filter transients at the edges aside, a band-internal tone passes unchanged
+            np.testing.assert_allclose(resampled[500:-500], sine(440, dst_rate)[500:-500], atol=1e-3)
+
+    def test_fused_down_up(self):
+        audio = sine(440, 16000) + sine(6000, 16000)
+        sample = LabeledSample(AUDIO_TYPE_NP, audio, '', audio_format=AudioFormat(16000, 1, 2))
+        parse_augmentations(['resample[rate=8000]'])[0].apply(sample)
+        self.assertEqual(sample.audio.shape, audio.shape)
+        # The 6 kHz tone is beyond the 4 kHz band of 8 kHz audio
+        np.testing.assert_allclose(sample.audio[500:-500], sine(440, 16000)[500:-500], atol=1e-3)
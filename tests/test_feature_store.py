@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from deepspeech_training.util.feature_store import FeatureStore, FeatureStoreWriter, is_feature_store
+
+CONFIG = {'audio_sample_rate': 16000, 'feature_win_len': 32, 'feature_win_step': 20, 'n_input': 26}
+
+
+def create_features(index):
+    return np.arange((index + 1) * 3 * 26, dtype=np.float32).reshape(-1, 26) * (index + 1)
+
+
+class TestFeatureStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmp_dir, 'features')
+        with FeatureStoreWriter(self.store_dir, CONFIG, sources=['samples.sdb']) as writer:
+            self.assertFalse(is_feature_store(self.store_dir))
+            for index in range(5):
+                writer.add('sample:{}'.format(index), create_features(index), 'transcript {}'.format(index))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reading(self):
+        self.assertTrue(is_feature_store(self.store_dir))
+        self.assertEqual(sorted(os.listdir(self.store_dir)), ['features.npy', 'index.json', 'offsets.npy'])
+        store = FeatureStore(self.store_dir, config=CONFIG)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.sources, ['samples.sdb'])
+        self.assertIsInstance(store.features, np.memmap)
+        for index in range(5):
+            np.testing.assert_array_equal(store['sample:{}'.format(index)], create_features(index))
+            self.assertEqual(store.transcripts[index], 'transcript {}'.format(index))
+
+    def test_config_mismatch(self):
+        with self.assertRaises(ValueError):
+            FeatureStore(self.store_dir, config=dict(CONFIG, feature_win_step=10))
+
+    def test_no_overwrite(self):
+        with self.assertRaises(ValueError):
+            FeatureStoreWriter(self.store_dir, CONFIG)
+
+
+if __name__ == '__main__':
+    unittest.main()
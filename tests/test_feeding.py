@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+import tensorflow.compat.v1 as tfv1
+from deepspeech_training.util import mfcc
+from deepspeech_training.util.audio import mapped_pcm_from_file, vad_split_pcm
+from deepspeech_training.util.feature_store import FeatureStoreWriter
+from deepspeech_training.util.feeding import audio_to_features, bucket_batch_sizes, bucket_key_fn, create_dataset, \
+    split_audio_files
+
+FEATURE_CONFIG = {'audio_sample_rate': 16000, 'feature_win_len': 32, 'feature_win_step': 20, 'n_input': 26}
+
+
+@mock.patch('deepspeech_training.util.feeding.Config', mock.Mock(audio_step_samples=320.0))
+@mock.patch('deepspeech_training.util.feeding.FLAGS', mock.Mock(audio_sample_rate=16000))
+class TestBucketBatchSizes(unittest.TestCase):
+    def test_frame_boundaries(self):
+        frame_boundaries, _ = bucket_batch_sizes([0.02, 1.0, 2.5, 10.0], 8)
+        self.assertEqual(frame_boundaries, [1, 50, 125, 500])
+
+    def test_fixed_batch_size(self):
+        _, batch_sizes = bucket_batch_sizes([1.0, 2.5], 8)
+        self.assertEqual(batch_sizes, [8, 8, 8])
+
+    def test_frame_budget(self):
+        _, batch_sizes = bucket_batch_sizes([1.0, 2.5, 10.0, 30.0], 8, frame_budget=1000)
+        # The last boundary exceeds the budget, but still gets batches of one - just like the overflow bucket
+        self.assertEqual(batch_sizes, [20, 8, 2, 1, 1])
+
+    def test_too_short_boundaries(self):
+        for boundaries in [[0.01, 1.0], [1.0, 1.01]]:
+            with self.assertRaises(ValueError):
+                bucket_batch_sizes(boundaries, 8, frame_budget=1000)
+
+
+class TestBucketKey(unittest.TestCase):
+    def test_bucket_indices(self):
+        features_len = tf.placeholder(dtype=tf.int32, shape=())
+        key = bucket_key_fn([50, 125, 500], None, None, features_len, None)
+        with tf.Session() as session:
+            keys = [session.run(key, feed_dict={features_len: n}) for n in [0, 49, 50, 124, 125, 499, 500, 5000]]
+        np.testing.assert_array_equal(keys, [0, 0, 1, 1, 2, 2, 3, 3])
+
+    def test_batched_lengths(self):
+        # Lengths of a padded batch still get one bucket index per sample
+        features_len = tf.placeholder(dtype=tf.int32, shape=(None,))
+        key = bucket_key_fn([50, 125, 500], None, None, features_len, None)
+        with tf.Session() as session:
+            keys = session.run(key, feed_dict={features_len: [0, 49, 50, 124, 125, 499, 500, 5000]})
+        np.testing.assert_array_equal(keys, [0, 0, 1, 1, 2, 2, 3, 3])
+
+
+@mock.patch('deepspeech_training.util.feeding.Config',
+            mock.Mock(audio_step_samples=320.0, n_input=26, num_devices=1,
+                      alphabet=mock.Mock(CanEncode=lambda transcript: True,
+                                         Encode=lambda transcript: [1] * len(transcript))))
+@mock.patch('deepspeech_training.util.feeding.FLAGS',
+            mock.Mock(audio_sample_rate=16000, feature_win_len=32, feature_win_step=20))
+class TestBucketBatching(unittest.TestCase):
+    # Sample lengths in feature frames - buckets of 1.0, 2.5 and 10.0 seconds end at 50, 125 and 500 frames
+    lengths = [10, 30, 45, 60, 60, 100, 200, 300, 400, 700, 800]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmp_dir, 'features')
+        with FeatureStoreWriter(self.store_dir, FEATURE_CONFIG) as writer:
+            for index, length in enumerate(self.lengths):
+                writer.add('sample:{}'.format(index), np.zeros((length, 26), dtype=np.float32), 'transcript')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _batch_lengths(self, **kwargs):
+        dataset = create_dataset([self.store_dir], bucket_boundaries=[1.0, 2.5, 10.0], train_phase=True, **kwargs)
+        batch = tfv1.data.make_one_shot_iterator(dataset).get_next()
+        batches = []
+        with tf.Session() as session:
+            while True:
+                try:
+                    _, (features, features_len), _ = session.run(batch)
+                except tf.errors.OutOfRangeError:
+                    break
+                self.assertEqual(features.shape[1], max(features_len))
+                batches.append(sorted(features_len.tolist()))
+        return sorted(batches)
+
+    def test_frame_budget(self):
+        # Batch sizes 20, 8, 2 and 1 - partial batches are kept, as they are also within budget
+        self.assertEqual(self._batch_lengths(batch_size=8, frame_budget=1000),
+                         [[10, 30, 45], [60, 60, 100], [200, 300], [400], [700], [800]])
+
+    def test_fixed_batch_size(self):
+        # Partial training batches get dropped
+        self.assertEqual(self._batch_lengths(batch_size=2), [[10, 30], [60, 60], [200, 300], [700, 800]])
+
+
+@mock.patch('deepspeech_training.util.feeding.Config',
+            mock.Mock(audio_window_samples=512, audio_step_samples=320, n_input=26))
+@mock.patch('deepspeech_training.util.feeding.FLAGS', mock.Mock(audio_sample_rate=16000))
+class TestFeatureParity(unittest.TestCase):
+    def test_numpy_features(self):
+        rng = np.random.RandomState(42)
+        audio = (rng.uniform(-0.5, 0.5, size=(16000, 1)) +
+                 0.3 * np.sin(np.arange(16000) * 0.05)[:, np.newaxis]).astype(np.float32)
+        features, features_len = audio_to_features(tf.constant(audio), 16000)
+        with tf.Session() as session:
+            expected, expected_len = session.run([features, features_len])
+        computed, computed_len = mfcc.audio_to_features(audio, 16000, 512, 320, dct_coefficient_count=26)
+        self.assertEqual(computed_len, expected_len)
+        np.testing.assert_allclose(computed, expected, rtol=1e-4, atol=1e-3)
+
+
+@mock.patch('deepspeech_training.util.feeding.Config',
+            mock.Mock(audio_window_samples=512, audio_step_samples=320, n_input=26, num_devices=1))
+@mock.patch('deepspeech_training.util.feeding.FLAGS', mock.Mock(audio_sample_rate=16000))
+class TestSplitAudioFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wav_paths = []
+        rng = np.random.RandomState(1)
+        for file_index, num_parts in enumerate([3, 0, 6]):
+            parts = [np.zeros(8000, dtype=np.int16)]
+            for _ in range(num_parts):
+                t = np.arange(rng.randint(5000, 80000))
+                parts.append((8000 * np.sin(t * 0.07) * np.sin(t * 0.0013) + rng.normal(0, 2000, len(t)))
+                             .astype(np.int16))
+                parts.append(np.zeros(rng.randint(10000, 40000), dtype=np.int16))
+            wav_path = os.path.join(self.tmp_dir, 'file{}.wav'.format(file_index))
+            with wave.open(wav_path, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(16000)
+                wav_file.writeframes(np.concatenate(parts).tobytes())
+            self.wav_paths.append(wav_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shared_batches(self):
+        expected = []
+        for file_index, wav_path in enumerate(self.wav_paths):
+            with mapped_pcm_from_file(wav_path) as pcm_data:
+                for segment, start, end in vad_split_pcm(pcm_data):
+                    segment.release()
+                    expected.append((file_index, start, end))
+        segment_counts = {}
+        dataset = split_audio_files(self.wav_paths, batch_size=3, outlier_duration_ms=3000, outlier_batch_size=1,
+                                    file_done_callback=segment_counts.__setitem__)
+        batch = tfv1.data.make_one_shot_iterator(dataset).get_next()
+        segments = []
+        with tf.Session() as session:
+            while True:
+                try:
+                    file_indices, starts, ends, features, features_len = session.run(batch)
+                except tf.errors.OutOfRangeError:
+                    break
+                self.assertEqual(features.shape[1], max(features_len))
+                outliers = set(end - start > 3000 for start, end in zip(starts, ends))
+                # Outliers are batched on their own
+                self.assertEqual(len(outliers), 1)
+                self.assertLessEqual(len(file_indices), 1 if True in outliers else 3)
+                segments.extend(zip(file_indices.tolist(), starts.tolist(), ends.tolist()))
+        self.assertEqual(sorted(segments), sorted(expected))
+        self.assertEqual(segment_counts, {file_index: sum(1 for segment in expected if segment[0] == file_index)
+                                          for file_index in range(len(self.wav_paths))})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from deepspeech_training.util.io import RemoteFileCache
+
+
+class TestRemoteFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.remote_dir = os.path.join(self.tmp_dir, 'remote')
+        os.makedirs(self.remote_dir)
+        for index in range(5):
+            with open(os.path.join(self.remote_dir, 'file{}'.format(index)), 'wb') as remote_file:
+                remote_file.write(bytes([index]) * 100)
+        gfile = mock.patch('deepspeech_training.util.io.gfile')
+        self.addCleanup(gfile.stop)
+        gfile.start().GFile.side_effect = lambda path, mode: open(path.replace('gs://', self.remote_dir + '/'), mode)
+        self.cache = RemoteFileCache(os.path.join(self.tmp_dir, 'cache'), 350)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, index):
+        with self.cache.open('gs://file{}'.format(index)) as cached_file:
+            return cached_file.read()
+
+    def test_hits_and_misses(self):
+        for _ in range(3):
+            self.assertEqual(self._read(1), bytes([1]) * 100)
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 1, 'size': 100})
+
+    def test_eviction(self):
+        for index in range(3):
+            self._read(index)
+        os.utime(self.cache.get_path('gs://file0'), (0, 0))
+        os.utime(self.cache.get_path('gs://file1'), (0, 1))
+        self._read(3)  # exceeds the size cap and evicts least recently used files
+        self.assertEqual(self.cache.stats()['size'], 300)
+        self.assertEqual(len(os.listdir(self.cache.cache_dir)), 3)
+        misses = self.cache.stats()['misses']
+        for index in [1, 2, 3]:
+            self._read(index)
+        self.assertEqual(self.cache.stats()['misses'], misses)
+        self._read(0)
+        self.assertEqual(self.cache.stats()['misses'], misses + 1)
+
+    def test_oversized_file(self):
+        with open(os.path.join(self.remote_dir, 'large'), 'wb') as remote_file:
+            remote_file.write(b'x' * 1000)
+        self._read(0)
+        with self.cache.open('gs://large') as cached_file:
+            self.assertEqual(cached_file.read(), b'x' * 1000)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 2, 'size': 1000})
+        self._read(1)  # evicts the oversized file
+        self.assertEqual(self.cache.stats()['size'], 100)
+
+    def test_open_fallback(self):
+        with mock.patch.object(self.cache, 'get_path', side_effect=FileNotFoundError):
+            with self.cache.open('gs://file2') as remote_file:
+                self.assertEqual(remote_file.read(), bytes([2]) * 100)
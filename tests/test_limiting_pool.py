@@ -0,0 +1,39 @@
+import time
+import unittest
+
+from deepspeech_training.util.helpers import LimitingPool
+
+
+def square(value):
+    return value * value
+
+
+class TestLimitingPool(unittest.TestCase):
+    def test_order(self):
+        with LimitingPool(processes=2, process_ahead=3) as pool:
+            self.assertEqual(list(pool.imap(square, range(50))), [value * value for value in range(50)])
+
+    def test_bounded_ahead_processing(self):
+        fed = []
+
+        def feed():
+            for value in range(100):
+                fed.append(value)
+                yield value
+
+        with LimitingPool(processes=2, process_ahead=4) as pool:
+            for index, _ in enumerate(pool.imap(square, feed())):
+                time.sleep(0.001)
+                # consumed results + results in flight + one item waiting to get fed
+                self.assertLessEqual(len(fed), index + 1 + 4 + 1)
+            stats = pool.stats()
+        self.assertEqual(stats['results'], 100)
+        self.assertLessEqual(stats['mean_depth'], 4)
+        self.assertGreater(stats['feeding_wait_time'], 0.0)
+
+    def test_abandoned_iteration(self):
+        with LimitingPool(processes=2, process_ahead=2) as pool:
+            results = pool.imap(square, range(1000))
+            self.assertEqual(next(results), 0)
+            results.close()
+            self.assertEqual(list(pool.imap(square, range(10))), [value * value for value in range(10)])
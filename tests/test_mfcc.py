@@ -0,0 +1,87 @@
+import math
+import unittest
+
+import numpy as np
+from deepspeech_training.util.mfcc import audio_to_features, fft_length, mel_weights, mfcc, spectrogram
+
+
+def reference_mel_filterbank(spectrum, sample_rate, num_channels, lower_limit, upper_limit):
+    # Straight port of the loops in TensorFlow's MfccMelFilterbank
+    def freq_to_mel(freq):
+        return 1127.0 * math.log1p(freq / 700.0)
+    input_length = len(spectrum)
+    mel_low = freq_to_mel(lower_limit)
+    mel_spacing = (freq_to_mel(upper_limit) - mel_low) / (num_channels + 1)
+    centers = [mel_low + mel_spacing * (i + 1) for i in range(num_channels + 1)]
+    hz_per_sbin = 0.5 * sample_rate / (input_length - 1)
+    start_index = int(1.5 + lower_limit / hz_per_sbin)
+    end_index = int(upper_limit / hz_per_sbin)
+    output = [0.0] * num_channels
+    channel = 0
+    for i in range(start_index, end_index + 1):
+        mel = freq_to_mel(i * hz_per_sbin)
+        while channel < num_channels and centers[channel] < mel:
+            channel += 1
+        band = channel - 1
+        if band >= 0:
+            weight = (centers[band + 1] - mel) / (centers[band + 1] - centers[band])
+        else:
+            weight = (centers[0] - mel) / (centers[0] - mel_low)
+        value = math.sqrt(spectrum[i])
+        if band >= 0:
+            output[band] += value * weight
+        if band + 1 < num_channels:
+            output[band + 1] += value - value * weight
+    return np.array(output)
+
+
+class TestMFCC(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.audio = (rng.uniform(-0.5, 0.5, size=(8000, 1)) +
+                      0.3 * np.sin(np.arange(8000) * 0.05)[:, np.newaxis]).astype(np.float32)
+
+    def test_spectrogram(self):
+        self.assertEqual(fft_length(512), 512)
+        self.assertEqual(fft_length(513), 1024)
+        spec = spectrogram(self.audio, 512, 320)
+        self.assertEqual(spec.shape, (1 + (8000 - 512) // 320, 257))
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(512) / 512)
+        for frame in [0, 7, len(spec) - 1]:
+            expected = np.abs(np.fft.rfft(self.audio[frame * 320:frame * 320 + 512, 0] * window)) ** 2
+            np.testing.assert_allclose(spec[frame], expected, rtol=1e-4, atol=1e-6)
+        self.assertEqual(spectrogram(self.audio[:100], 512, 320).shape, (0, 257))
+
+    def test_mel_filterbank(self):
+        spec = spectrogram(self.audio, 512, 320).astype(np.float64)
+        weights = mel_weights(257, 16000.0, 40, 20.0, 8000.0)
+        for frame in [0, 5]:
+            expected = reference_mel_filterbank(spec[frame], 16000, 40, 20.0, 8000.0)
+            np.testing.assert_allclose(np.sqrt(spec[frame]) @ weights, expected, rtol=1e-10)
+
+    def test_features(self):
+        features, num_frames = audio_to_features(self.audio, 16000, 512, 320)
+        self.assertEqual(features.shape, (num_frames, 26))
+        self.assertEqual(features.dtype, np.float32)
+        spec = spectrogram(self.audio, 512, 320).astype(np.float64)
+        log_mel = np.log(np.maximum(reference_mel_filterbank(spec[3], 16000, 40, 20.0, 8000.0), 1e-12))
+        expected = [sum(log_mel[j] * math.sqrt(2 / 40) * math.cos(math.pi / 40 * i * (j + 0.5)) for j in range(40))
+                    for i in range(26)]
+        np.testing.assert_allclose(features[3], expected, rtol=1e-4, atol=1e-4)
+        with self.assertRaises(ValueError):
+            mfcc(spec, 16000, dct_coefficient_count=41)
+
+    def test_batch(self):
+        batch = np.stack([self.audio[:, 0], self.audio[::-1, 0], np.zeros(8000, dtype=np.float32)])
+        features, num_frames = audio_to_features(batch, 16000, 512, 320)
+        self.assertEqual(features.shape, (3, num_frames, 26))
+        for signal, signal_features in zip(batch, features):
+            expected, _ = audio_to_features(signal, 16000, 512, 320)
+            np.testing.assert_array_equal(signal_features, expected)
+        self.assertEqual(spectrogram(batch[:, :100], 512, 320).shape, (3, 0, 257))
+        with self.assertRaises(ValueError):
+            spectrogram(batch[:, :, np.newaxis], 512, 320)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,291 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from deepspeech_training.util.audio import AUDIO_TYPE_PCM, AUDIO_TYPE_WAV, DEFAULT_FORMAT, BufferFile
+from deepspeech_training.util.sample_collections import (
+    CSV,
+    DirectSDBWriter,
+    LabeledSample,
+    PackedSample,
+    ParallelSDBWriter,
+    SDB,
+    SHARD_QUEUE_SIZE,
+    SampleList,
+    ShardedSDBWriter,
+    samples_from_sources,
+    unpack_maybe,
+)
+
+
+def write_sdb(sdb_path, indices, **kwargs):
+    with DirectSDBWriter(sdb_path, audio_type=AUDIO_TYPE_WAV, **kwargs) as writer:
+        for index in indices:
+            writer.add(create_sample(index))
+
+
+def create_sample(index):
+    num_frames = (index + 1) * 160
+    pcm = (np.arange(num_frames, dtype=np.int16) * (index + 1)).tobytes()
+    return LabeledSample(AUDIO_TYPE_PCM, pcm, 'transcript {}'.format(index), audio_format=DEFAULT_FORMAT)
+
+
+class TestSDB(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.sdb_path = os.path.join(self.tmp_dir, 'samples.sdb')
+        write_sdb(self.sdb_path, range(10))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_samples(self, sdb, reverse=False):
+        self.assertEqual(len(sdb), 10)
+        for i, sample in enumerate(sdb):
+            index = 9 - i if reverse else i
+            expected = create_sample(index)
+            self.assertEqual(sample.transcript, expected.transcript)
+            self.assertAlmostEqual(sample.duration, expected.duration)
+            sample.change_audio_type(AUDIO_TYPE_PCM)
+            self.assertEqual(bytes(sample.audio), expected.audio)
+
+    def test_buffered(self):
+        self._check_samples(SDB(self.sdb_path))
+
+    def test_buffered_reverse(self):
+        self._check_samples(SDB(self.sdb_path, reverse=True), reverse=True)
+
+    def test_memory_mapped(self):
+        sdb = SDB(self.sdb_path, memory_map=True)
+        audio_data, transcript = sdb.read_row(3, sdb.speech_index, sdb.transcript_index)
+        self.assertIsInstance(audio_data, memoryview)
+        self.assertEqual(bytes(transcript), b'transcript 3')
+        # Audio is read in place and only copied when pickled
+        sample = sdb[3]
+        self.assertIsInstance(sample.audio, BufferFile)
+        self.assertEqual(sample.audio.getbuffer().obj, audio_data.obj)
+        restored = pickle.loads(pickle.dumps(sample))
+        self.assertEqual(restored.audio.getvalue(), sample.audio.getvalue())
+        self._check_samples(sdb)
+        sdb.close()
+
+    def test_offset_index(self):
+        for memory_map in [False, True]:
+            sdb = SDB(self.sdb_path, memory_map=memory_map)
+            self.assertIsInstance(sdb.offsets, np.ndarray)
+            self.assertEqual(sdb.offsets.shape, (10,))
+            self.assertTrue(np.all(np.diff(sdb.offsets.astype(np.int64)) > 0))
+
+    def test_empty(self):
+        empty_path = os.path.join(self.tmp_dir, 'empty.sdb')
+        with DirectSDBWriter(empty_path, audio_type=AUDIO_TYPE_WAV):
+            pass
+        for memory_map in [False, True]:
+            self.assertEqual(len(SDB(empty_path, memory_map=memory_map)), 0)
+
+    def test_memory_mapped_reverse(self):
+        self._check_samples(SDB(self.sdb_path, reverse=True, memory_map=True), reverse=True)
+
+    def test_durations(self):
+        for memory_map in [False, True]:
+            for reverse in [False, True]:
+                sdb = SDB(self.sdb_path, reverse=reverse, memory_map=memory_map)
+                self.assertEqual(list(sdb.durations), [sample.duration for sample in sdb])
+
+    def test_no_durations(self):
+        sdb_path = os.path.join(self.tmp_dir, 'no-durations.sdb')
+        write_sdb(sdb_path, range(3), durations=False)
+        sdb = SDB(sdb_path)
+        self.assertIsNone(sdb.durations)
+        self._check_samples_equal(sdb, range(3))
+
+    def _check_samples_equal(self, samples, indices):
+        indices = list(indices)
+        self.assertEqual(len(samples), len(indices))
+        self.assertEqual([sample.transcript for sample in samples],
+                         [create_sample(index).transcript for index in indices])
+
+    def test_interleaving(self):
+        sdb_a = os.path.join(self.tmp_dir, 'a.sdb')
+        sdb_b = os.path.join(self.tmp_dir, 'b.sdb')
+        for durations in [True, False]:
+            write_sdb(sdb_a, [0, 3, 4, 8], durations=durations)
+            write_sdb(sdb_b, [1, 2, 5, 6, 7, 9], durations=durations)
+            self._check_samples_equal(samples_from_sources([sdb_a, sdb_b]), range(10))
+            self._check_samples_equal(samples_from_sources([sdb_a, sdb_b], reverse=True), reversed(range(10)))
+
+    def test_columnar(self):
+        sdb_path = os.path.join(self.tmp_dir, 'columnar.sdb')
+        with mock.patch('deepspeech_training.util.sample_collections.TRANSCRIPT_BLOCK_SIZE', 4):
+            write_sdb(sdb_path, range(10), columnar=True)
+        for memory_map in [False, True]:
+            sdb = SDB(sdb_path, memory_map=memory_map)
+            self.assertEqual(len(sdb.schema), 1)
+            self.assertEqual(list(sdb.transcripts()), [create_sample(index).transcript for index in range(10)])
+            self._check_samples(sdb)
+            self._check_samples(SDB(sdb_path, reverse=True, memory_map=memory_map), reverse=True)
+        self.assertEqual(list(SDB(self.sdb_path).transcripts()), list(SDB(sdb_path).transcripts()))
+
+    def test_columnar_blocks(self):
+        sdb_path = os.path.join(self.tmp_dir, 'columnar.sdb')
+        with mock.patch('deepspeech_training.util.sample_collections.TRANSCRIPT_BLOCK_SIZE', 4):
+            with DirectSDBWriter(sdb_path, audio_type=AUDIO_TYPE_WAV, columnar=True) as writer:
+                for index in range(10):
+                    writer.add(create_sample(index))
+                    # Full blocks are compressed right away
+                    self.assertEqual(len(writer.transcript_blocks), (index + 1) // 4)
+                    self.assertEqual(len(writer.transcript_block), (index + 1) % 4)
+        self.assertEqual(list(SDB(sdb_path).transcripts()), [create_sample(i).transcript for i in range(10)])
+        self.assertNotIsInstance(SDB(sdb_path, labeled=False)[0], LabeledSample)
+
+
+class TestShardedSDB(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.tmp_dir, 'samples.sdbs')
+        with ShardedSDBWriter(self.manifest_path, num_shards=4, audio_type=AUDIO_TYPE_WAV, workers=2) as writer:
+            for index in range(10):
+                writer.add(create_sample(index))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_transcripts(self, samples, indices):
+        self.assertEqual([sample.transcript for sample in samples],
+                         [create_sample(index).transcript for index in indices])
+
+    def test_shard_files(self):
+        for shard_index, num_samples in enumerate([3, 3, 2, 2]):
+            shard_path = os.path.join(self.tmp_dir, 'samples.{:05d}.sdb'.format(shard_index))
+            self._check_transcripts(SDB(shard_path), range(shard_index, 10, 4))
+            self.assertEqual(len(SDB(shard_path)), num_samples)
+
+    def test_reading(self):
+        samples = samples_from_sources([self.manifest_path])
+        self._check_transcripts(samples, range(10))
+        self.assertEqual(list(samples.durations), [sample.duration for sample in samples])
+
+    def test_reading_reverse(self):
+        samples = samples_from_sources([self.manifest_path], reverse=True)
+        self._check_transcripts(samples, reversed(range(10)))
+        self.assertEqual(list(samples.durations), [sample.duration for sample in samples])
+
+    def test_dead_worker(self):
+        writer = ShardedSDBWriter(os.path.join(self.tmp_dir, 'dead.sdbs'), audio_type=AUDIO_TYPE_WAV, workers=1)
+        writer.processes[0].terminate()
+        writer.processes[0].join()
+        for _ in range(SHARD_QUEUE_SIZE):
+            writer.queues[0].put(None)
+        # Neither adding nor closing must block forever on the full queue of the exited worker
+        with self.assertRaises(RuntimeError):
+            writer.add(create_sample(0))
+        with self.assertRaises(RuntimeError):
+            writer.close()
+
+    def test_partitions(self):
+        for num_partitions in [1, 2, 3, 4]:
+            for partition_index in range(num_partitions):
+                samples = samples_from_sources([self.manifest_path], partition=(num_partitions, partition_index))
+                self._check_transcripts(samples, range(partition_index, 10, num_partitions))
+                self.assertEqual([sample.sample_id for sample in samples],
+                                 ['{}:{}'.format(self.manifest_path, i)
+                                  for i in range(partition_index, 10, num_partitions)])
+                self.assertEqual(list(samples.durations), [sample.duration for sample in samples])
+                if 4 % num_partitions == 0:
+                    self.assertEqual(sum(shard is not None for shard in samples.shards), 4 // num_partitions)
+
+
+class TestParallelSDBWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.sdb_path = os.path.join(self.tmp_dir, 'samples.sdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stitched_sdb(self):
+        with ParallelSDBWriter(self.sdb_path, audio_type=AUDIO_TYPE_WAV, workers=3) as writer:
+            for index in range(10):
+                writer.add(create_sample(index))
+        self.assertEqual(os.listdir(self.tmp_dir), ['samples.sdb'])
+        sdb = SDB(self.sdb_path)
+        self.assertEqual([sample.transcript for sample in sdb], [create_sample(i).transcript for i in range(10)])
+        self.assertEqual(list(sdb.durations), [create_sample(i).duration for i in range(10)])
+        reference_path = os.path.join(self.tmp_dir, 'reference.sdb')
+        write_sdb(reference_path, range(10))
+        reference = SDB(reference_path)
+        self.assertEqual([sdb.read_entry(i) for i in range(10)], [reference.read_entry(i) for i in range(10)])
+
+    def test_columnar(self):
+        with mock.patch('deepspeech_training.util.sample_collections.TRANSCRIPT_BLOCK_SIZE', 4):
+            with ParallelSDBWriter(self.sdb_path, audio_type=AUDIO_TYPE_WAV, workers=3, columnar=True) as writer:
+                for index in range(10):
+                    writer.add(create_sample(index))
+        sdb = SDB(self.sdb_path)
+        self.assertEqual(len(sdb.schema), 1)
+        self.assertEqual(list(sdb.transcripts()), [create_sample(i).transcript for i in range(10)])
+        self.assertEqual([sample.transcript for sample in sdb], [create_sample(i).transcript for i in range(10)])
+
+
+class TestCSV(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, 'samples.csv')
+        with open(self.csv_path, 'w') as csv_file:
+            csv_file.write('wav_filename,wav_filesize,transcript\n')
+            for index in range(10):
+                sample = create_sample(index)
+                sample.change_audio_type(AUDIO_TYPE_WAV)
+                wav_filename = 'sample{}.wav'.format(index)
+                with open(os.path.join(self.tmp_dir, wav_filename), 'wb') as wav_file:
+                    wav_file.write(sample.audio.getbuffer())
+                csv_file.write('{},{},{}\n'.format(wav_filename, index, sample.transcript))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_order(self):
+        sizes = [5, 3, 5, 1, 3]
+        rows = [('sample{}.wav'.format(index), size, 'transcript') for index, size in enumerate(sizes)]
+        for reverse in [False, True]:
+            samples = SampleList(rows, reverse=reverse)
+            self.assertEqual([sample.filename for sample in samples],
+                             [row[0] for row in sorted(rows, key=lambda row: row[1], reverse=reverse)])
+
+    def test_paths(self):
+        samples = CSV(self.csv_path)
+        self.assertEqual(samples[3].filename, os.path.join(self.tmp_dir, 'sample3.wav'))
+        self.assertEqual(samples[3].label, 'transcript 3')
+
+    def test_read_ahead(self):
+        for reverse in [False, True]:
+            expected = [unpack_maybe(sample) for sample in CSV(self.csv_path, reverse=reverse)]
+            for read_ahead in [1, 3, 20]:
+                samples = list(CSV(self.csv_path, reverse=reverse, read_ahead=read_ahead))
+                self.assertTrue(all(isinstance(sample, LabeledSample) for sample in samples))
+                self.assertEqual([sample.transcript for sample in samples], [sample.transcript for sample in expected])
+                self.assertEqual([sample.audio.getvalue() for sample in samples],
+                                 [sample.audio.getvalue() for sample in expected])
+
+
+class TestSamplePickling(unittest.TestCase):
+    def test_labeled_sample(self):
+        sample = create_sample(3)
+        sample.sample_id = 'test:3'
+        restored = pickle.loads(pickle.dumps(sample))
+        self.assertFalse(hasattr(restored, '__dict__'))
+        for attribute in ['audio_type', 'audio_format', 'sample_id', 'audio', 'duration', 'transcript']:
+            self.assertEqual(getattr(restored, attribute), getattr(sample, attribute))
+
+    def test_packed_sample(self):
+        sample = PackedSample('test.wav', AUDIO_TYPE_WAV, 'transcript')
+        restored = pickle.loads(pickle.dumps(sample))
+        self.assertEqual((restored.filename, restored.audio_type, restored.label), ('test.wav', AUDIO_TYPE_WAV, 'transcript'))
+
+
+if __name__ == '__main__':
+    unittest.main()
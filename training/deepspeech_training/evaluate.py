@@ -54,7 +54,12 @@ def evaluate(test_csvs, create_model):
                                 batch_size=FLAGS.test_batch_size,
                                 train_phase=False,
                                 reverse=FLAGS.reverse_test,
-                                limit=FLAGS.limit_test) for csv in test_csvs]
+                                limit=FLAGS.limit_test,
+                                buffering=FLAGS.read_buffer,
+                                memory_map=FLAGS.read_memory_map,
+                                read_ahead=FLAGS.read_ahead,
+                                shared_audio_slot=FLAGS.shared_audio_slot,
+                                loading_executor=FLAGS.loading_executor) for csv in test_csvs]
     iterator = tfv1.data.Iterator.from_structure(tfv1.data.get_output_types(test_sets[0]),
                                                  tfv1.data.get_output_shapes(test_sets[0]),
                                                  output_classes=tfv1.data.get_output_classes(test_sets[0]))
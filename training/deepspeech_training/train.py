@@ -31,11 +31,12 @@ from six.moves import zip, range
 from .util.config import Config, initialize_globals
 from .util.checkpoints import load_or_init_graph_for_training, load_graph_for_evaluation, reload_best_checkpoint
 from .util.evaluate_tools import save_samples_json
-from .util.feeding import create_dataset, audio_to_features, audiofile_to_features
+from .util.augmentations import AugmentationPool
+from .util.feeding import create_dataset, audio_to_features, audiofile_to_features, bucket_batch_sizes
 from .util.flags import create_flags, FLAGS
 from .util.helpers import check_ctcdecoder_version, ExceptionBox
 from .util.logging import create_progressbar, log_debug, log_error, log_info, log_progress, log_warn
-from .util.io import open_remote, remove_remote, listdir_remote, is_remote_path, isdir_remote
+from .util.io import open_remote, remove_remote, listdir_remote, is_remote_path, isdir_remote, get_remote_cache
 
 check_ctcdecoder_version()
 
@@ -419,6 +420,20 @@ def train():
     # Create training and validation datasets
     split_dataset = FLAGS.horovod
 
+    train_batch_size = FLAGS.train_batch_size
+    if FLAGS.train_frame_budget > 0:
+        # Largest batch size of all duration buckets
+        train_batch_size = max(bucket_batch_sizes(Config.bucket_boundaries, FLAGS.train_batch_size,
+                                                  frame_budget=FLAGS.train_frame_budget)[1])
+
+    # Sample processing workers are started once and shared by the training, dev and metrics sets of all epochs
+    augmentation_pool = AugmentationPool(Config.augmentations,
+                                         buffering=FLAGS.read_buffer,
+                                         process_ahead=Config.num_devices * max(train_batch_size,
+                                                                                FLAGS.dev_batch_size) * 2,
+                                         shared_audio_slot_size=int(FLAGS.shared_audio_slot * FLAGS.audio_sample_rate),
+                                         executor=FLAGS.loading_executor)
+
     train_set = create_dataset(FLAGS.train_files.split(','),
                                batch_size=FLAGS.train_batch_size,
                                epochs=FLAGS.epochs,
@@ -426,10 +441,18 @@ def train():
                                cache_path=FLAGS.feature_cache,
                                train_phase=True,
                                exception_box=exception_box,
-                               process_ahead=Config.num_devices * FLAGS.train_batch_size * 2,
+                               process_ahead=Config.num_devices * train_batch_size * 2,
                                reverse=FLAGS.reverse_train,
                                limit=FLAGS.limit_train,
+                               bucket_boundaries=Config.bucket_boundaries,
+                               batch_shuffle_buffer=FLAGS.batch_shuffle_buffer,
+                               frame_budget=FLAGS.train_frame_budget,
                                buffering=FLAGS.read_buffer,
+                               memory_map=FLAGS.read_memory_map,
+                               read_ahead=FLAGS.read_ahead,
+                               shared_audio_slot=FLAGS.shared_audio_slot,
+                               loading_executor=FLAGS.loading_executor,
+                               augmentation_pool=augmentation_pool,
                                split_dataset=split_dataset)
 
     iterator = tfv1.data.Iterator.from_structure(tfv1.data.get_output_types(train_set),
@@ -449,6 +472,11 @@ def train():
                                    reverse=FLAGS.reverse_dev,
                                    limit=FLAGS.limit_dev,
                                    buffering=FLAGS.read_buffer,
+                                   memory_map=FLAGS.read_memory_map,
+                                   read_ahead=FLAGS.read_ahead,
+                                   shared_audio_slot=FLAGS.shared_audio_slot,
+                                   loading_executor=FLAGS.loading_executor,
+                                   augmentation_pool=augmentation_pool,
                                    split_dataset=split_dataset) for source in dev_sources]
         dev_init_ops = [iterator.make_initializer(dev_set) for dev_set in dev_sets]
 
@@ -462,6 +490,11 @@ def train():
                                        reverse=FLAGS.reverse_dev,
                                        limit=FLAGS.limit_dev,
                                        buffering=FLAGS.read_buffer,
+                                       memory_map=FLAGS.read_memory_map,
+                                       read_ahead=FLAGS.read_ahead,
+                                       shared_audio_slot=FLAGS.shared_audio_slot,
+                                       loading_executor=FLAGS.loading_executor,
+                                       augmentation_pool=augmentation_pool,
                                        split_dataset=split_dataset) for source in metrics_sources]
         metrics_init_ops = [iterator.make_initializer(metrics_set) for metrics_set in metrics_sets]
 
@@ -547,7 +580,7 @@ def train():
     if FLAGS.horovod:
         bcast = hvd.broadcast_global_variables(0)
 
-    with tfv1.Session(config=Config.session_config) as session:
+    with tfv1.Session(config=Config.session_config) as session, augmentation_pool:
         log_debug('Session opened.')
 
         # Prevent further graph changes
@@ -641,6 +674,14 @@ def train():
                 train_loss, _ = run_set('train', epoch, train_init_op)
                 if Config.is_master_process:
                     log_progress('Finished training epoch %d - loss: %f' % (epoch, train_loss))
+                    if get_remote_cache() is not None:
+                        log_info('Remote file cache: {hits} hits, {misses} misses, {size} bytes cached'
+                                 .format(**get_remote_cache().stats()))
+                    # For tuning --loading_executor and the number of samples processed ahead (see LimitingPool.stats)
+                    log_debug('Sample loading: {results} samples, mean queue depth {mean_depth:.1f}, '
+                              '{feeding_wait_time:.1f}s waiting for consumption (workers saturated), '
+                              '{consuming_wait_time:.1f}s waiting for samples (workers starving)'
+                              .format(**augmentation_pool.stats()))
                     checkpoint_saver.save(session, checkpoint_path, global_step=global_step)
 
                 if FLAGS.dev_files:
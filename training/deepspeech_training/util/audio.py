@@ -2,6 +2,7 @@ import collections
 import ctypes
 import io
 import math
+import mmap
 import numpy as np
 import os
 import pyogg
@@ -10,6 +11,8 @@ import wave
 
 from .helpers import LimitingPool
 from collections import namedtuple
+from contextlib import contextmanager
+from threading import local
 from .io import open_remote, remove_remote, copy_remote, is_remote_path
 
 AudioFormat = namedtuple('AudioFormat', 'rate channels width')
@@ -32,6 +35,57 @@ OPUS_RATE_SIZE = 4
 OPUS_CHANNELS_SIZE = 1
 OPUS_WIDTH_SIZE = 1
 OPUS_CHUNK_LEN_SIZE = 2
+OPUS_BITRATE_AUTO = -1000  # OPUS_AUTO of libopus
+
+_opus_codecs = local()  # per thread cache of Opus encoders and decoders
+
+
+class BufferFile:
+    """
+    Read-only memory file (like io.BytesIO) over an existing buffer - e.g. a memoryview into a memory-mapped SDB.
+    Unlike io.BytesIO it does not copy the buffer, but only the parts that get read.
+    Pickles as io.BytesIO, so that samples can still be passed to other processes.
+    """
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.buffer) if size is None or size < 0 else min(len(self.buffer), self.position + size)
+        data = bytes(self.buffer[self.position:end])
+        self.position = max(self.position, end)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        if offset < 0:
+            raise ValueError('Negative seek position {}'.format(offset))
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def getbuffer(self):
+        return self.buffer
+
+    def getvalue(self):
+        return bytes(self.buffer)
+
+    def close(self):
+        self.buffer.release()
+
+    def __reduce__(self):
+        return io.BytesIO, (self.getvalue(),)
 
 
 class Sample:
@@ -49,6 +103,10 @@ class Sample:
     duration : float
         Audio duration of the sample in seconds
     """
+    # Samples are created and passed between processes in large numbers: Slots avoid a per-instance __dict__
+    # and state tuples keep pickling lean.
+    __slots__ = ('audio_type', 'audio_format', 'sample_id', 'audio', 'duration')
+
     def __init__(self, audio_type, raw_data, audio_format=None, sample_id=None):
         """
         Parameters
@@ -64,6 +122,7 @@ class Sample:
         raw_data : binary
             Audio data in the form of the provided representation type (see audio_type).
             For types util.audio.AUDIO_TYPE_OPUS or util.audio.AUDIO_TYPE_WAV data can also be passed as a bytearray.
+            Passing a memoryview (e.g. into a memory-mapped SDB) lets them read it in place (see BufferFile).
         audio_format : util.audio.AudioFormat
             Required in case of audio_type = util.audio.AUDIO_TYPE_PCM or util.audio.AUDIO_TYPE_NP,
             as this information cannot be derived from raw audio data.
@@ -74,7 +133,13 @@ class Sample:
         self.audio_format = audio_format
         self.sample_id = sample_id
         if audio_type in SERIALIZABLE_AUDIO_TYPES:
-            self.audio = raw_data if isinstance(raw_data, io.BytesIO) else io.BytesIO(raw_data)
+            if isinstance(raw_data, (io.BytesIO, BufferFile)):
+                self.audio = raw_data
+            elif isinstance(raw_data, memoryview) and audio_type != AUDIO_TYPE_OGG_OPUS:
+                # Ogg/Opus decoding requires a writable buffer
+                self.audio = BufferFile(raw_data)
+            else:
+                self.audio = io.BytesIO(raw_data)
             self.duration = read_duration(audio_type, self.audio)
             if not self.audio_format:
                 self.audio_format = read_format(audio_type, self.audio)
@@ -108,6 +173,11 @@ class Sample:
             self.audio = audio
         elif new_audio_type == AUDIO_TYPE_PCM and self.audio_type == AUDIO_TYPE_NP:
             self.audio = np_to_pcm(self.audio, self.audio_format)
+        elif new_audio_type == AUDIO_TYPE_NP and self.audio_type == AUDIO_TYPE_OPUS:
+            # Decoded samples go straight into the float conversion without a detour through PCM bytes
+            self.audio_format, pcm = decode_opus(self.audio)
+            self.audio.close()
+            self.audio = pcm_to_np(pcm, self.audio_format)
         elif new_audio_type == AUDIO_TYPE_NP:
             self.change_audio_type(AUDIO_TYPE_PCM)
             self.audio = pcm_to_np(self.audio, self.audio_format)
@@ -122,6 +192,12 @@ class Sample:
                                .format(self.audio_type, new_audio_type))
         self.audio_type = new_audio_type
 
+    def __getstate__(self):
+        return self.audio_type, self.audio_format, self.sample_id, self.audio, self.duration
+
+    def __setstate__(self, state):
+        self.audio_type, self.audio_format, self.sample_id, self.audio, self.duration = state
+
 
 def _unpack_and_change_audio_type(sample_and_audio_type):
     packed_sample, audio_type, bitrate = sample_and_audio_type
@@ -243,12 +319,7 @@ def read_frames_from_file(audio_path, audio_format=DEFAULT_FORMAT, frame_duratio
             yield frame
 
 
-def vad_split(audio_frames,
-              audio_format=DEFAULT_FORMAT,
-              num_padding_frames=10,
-              threshold=0.5,
-              aggressiveness=3):
-    from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+def check_vad_parameters(audio_format, aggressiveness):
     if audio_format.channels != 1:
         raise ValueError('VAD-splitting requires mono samples')
     if audio_format.width != 2:
@@ -257,40 +328,208 @@ def vad_split(audio_frames,
         raise ValueError('VAD-splitting only supported for sample rates 8000, 16000, 32000, or 48000')
     if aggressiveness not in [0, 1, 2, 3]:
         raise ValueError('VAD-splitting aggressiveness mode has to be one of 0, 1, 2, or 3')
-    ring_buffer = collections.deque(maxlen=num_padding_frames)
-    triggered = False
+
+
+class VADSegmenter:
+    """
+    Incremental voice activity segmentation over a stream of per-frame speech decisions.
+    Keeps running counts of voiced frames within a window of padding frames instead of the frames themselves,
+    so that segments can be reported as frame index ranges.
+    """
+    def __init__(self, num_padding_frames=10, threshold=0.5):
+        self.window = collections.deque(maxlen=num_padding_frames)
+        self.num_voiced = 0
+        self.limit = threshold * num_padding_frames
+        self.triggered = False
+        self.segment_start = 0
+        self.frame_index = -1
+
+    def _clear_window(self):
+        self.window.clear()
+        self.num_voiced = 0
+
+    def push(self, is_speech):
+        """
+        Adds the speech decision of the next frame.
+
+        Returns
+        -------
+        tuple of int or None
+            Index range (start, stop) of a finished segment (stop exclusive) or None
+        """
+        self.frame_index += 1
+        if self.window.maxlen:
+            if len(self.window) == self.window.maxlen:
+                self.num_voiced -= self.window[0]
+            self.window.append(is_speech)
+            self.num_voiced += is_speech
+        if not self.triggered:
+            if self.num_voiced > self.limit:
+                self.triggered = True
+                self.segment_start = self.frame_index - len(self.window) + 1
+                self._clear_window()
+        elif len(self.window) - self.num_voiced > self.limit:
+            self.triggered = False
+            self._clear_window()
+            return self.segment_start, self.frame_index + 1
+        return None
+
+    def finish(self):
+        """
+        Returns
+        -------
+        tuple of int or None
+            Index range (start, stop) of the still open segment or None
+        """
+        if self.triggered:
+            self.triggered = False
+            return self.segment_start, self.frame_index + 1
+        return None
+
+
+def vad_segment_times(start, stop, frame_duration_ms, final=False):
+    """Start and end time of a VAD segment in ms (reproducing the historic vad_split timing)"""
+    if final:
+        return frame_duration_ms * (start - 1), frame_duration_ms * stop
+    return frame_duration_ms * max(0, start - 1), frame_duration_ms * (stop - 1)
+
+
+def vad_split(audio_frames,
+              audio_format=DEFAULT_FORMAT,
+              num_padding_frames=10,
+              threshold=0.5,
+              aggressiveness=3):
+    from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+    check_vad_parameters(audio_format, aggressiveness)
+    segmenter = VADSegmenter(num_padding_frames=num_padding_frames, threshold=threshold)
     vad = Vad(int(aggressiveness))
-    voiced_frames = []
+    # Frames that could still become part of a segment, starting with the one at index frames_start
+    frames = collections.deque()
+    frames_start = 0
     frame_duration_ms = 0
-    frame_index = 0
     for frame_index, frame in enumerate(audio_frames):
         frame_duration_ms = get_pcm_duration(len(frame), audio_format) * 1000
         if int(frame_duration_ms) not in [10, 20, 30]:
             raise ValueError('VAD-splitting only supported for frame durations 10, 20, or 30 ms')
-        is_speech = vad.is_speech(frame, audio_format.rate)
-        if not triggered:
-            ring_buffer.append((frame, is_speech))
-            num_voiced = len([f for f, speech in ring_buffer if speech])
-            if num_voiced > threshold * ring_buffer.maxlen:
-                triggered = True
-                for f, s in ring_buffer:
-                    voiced_frames.append(f)
-                ring_buffer.clear()
-        else:
-            voiced_frames.append(frame)
-            ring_buffer.append((frame, is_speech))
-            num_unvoiced = len([f for f, speech in ring_buffer if not speech])
-            if num_unvoiced > threshold * ring_buffer.maxlen:
-                triggered = False
-                yield b''.join(voiced_frames), \
-                      frame_duration_ms * max(0, frame_index - len(voiced_frames)), \
-                      frame_duration_ms * frame_index
-                ring_buffer.clear()
-                voiced_frames = []
-    if len(voiced_frames) > 0:
-        yield b''.join(voiced_frames), \
-              frame_duration_ms * (frame_index - len(voiced_frames)), \
-              frame_duration_ms * (frame_index + 1)
+        frames.append(frame)
+        segment = segmenter.push(vad.is_speech(frame, audio_format.rate))
+        if segment is not None:
+            yield (b''.join(frames[i - frames_start] for i in range(*segment)),
+                   *vad_segment_times(*segment, frame_duration_ms))
+        if not segmenter.triggered:
+            while len(frames) > num_padding_frames:
+                frames.popleft()
+            frames_start = frame_index + 1 - len(frames)
+    segment = segmenter.finish()
+    if segment is not None:
+        yield (b''.join(frames[i - frames_start] for i in range(*segment)),
+               *vad_segment_times(*segment, frame_duration_ms, final=True))
+
+
+def vad_split_pcm(pcm_data,
+                  audio_format=DEFAULT_FORMAT,
+                  frame_duration_ms=30,
+                  num_padding_frames=10,
+                  threshold=0.5,
+                  aggressiveness=3):
+    """
+    Splits a PCM buffer into voiced segments like vad_split applied to read_frames(..., frame_duration_ms).
+
+    Parameters
+    ----------
+    pcm_data : bytes-like object
+        PCM data (e.g. a memory-mapped WAV file's data chunk - see mapped_pcm_from_file)
+    audio_format : AudioFormat
+    frame_duration_ms : int
+        VAD frame duration - one of 10, 20 or 30
+    num_padding_frames : int
+        Number of frames that are considered for switching between voiced and unvoiced state
+    threshold : float
+        Ratio of the padding frames that have to be (un)voiced for switching state
+    aggressiveness : int
+        VAD aggressiveness mode between 0 (lowest) and 3 (highest)
+
+    Returns
+    -------
+    iterable of tuple of memoryview, float, float
+        Segment PCM data as a slice of pcm_data (no copy) with the segment's start and end time in ms
+    """
+    from webrtcvad import Vad  # pylint: disable=import-outside-toplevel
+    check_vad_parameters(audio_format, aggressiveness)
+    if frame_duration_ms not in [10, 20, 30]:
+        raise ValueError('VAD-splitting only supported for frame durations 10, 20, or 30 ms')
+    frame_size = int(audio_format.rate * (frame_duration_ms / 1000.0)) * audio_format.width
+    frame_duration_ms = get_pcm_duration(frame_size, audio_format) * 1000
+    segmenter = VADSegmenter(num_padding_frames=num_padding_frames, threshold=threshold)
+    vad = Vad(int(aggressiveness))
+    pcm_data = memoryview(pcm_data).cast('B')
+    try:
+        for frame_offset in range(0, len(pcm_data) - frame_size + 1, frame_size):
+            segment = segmenter.push(vad.is_speech(pcm_data[frame_offset:frame_offset + frame_size],
+                                                   audio_format.rate))
+            if segment is not None:
+                yield (pcm_data[segment[0] * frame_size:segment[1] * frame_size],
+                       *vad_segment_times(*segment, frame_duration_ms))
+        segment = segmenter.finish()
+        if segment is not None:
+            yield (pcm_data[segment[0] * frame_size:segment[1] * frame_size],
+                   *vad_segment_times(*segment, frame_duration_ms, final=True))
+    finally:
+        # This generator's frame can outlive it in a reference cycle (e.g. through tracebacks of the lazy import above).
+        # Its view must not keep the buffer exported, as a memory-mapped file could not be closed then.
+        pcm_data.release()
+
+
+def get_wav_data_range(wav_file):
+    """
+    Finds the PCM data chunk of a WAV file.
+
+    Returns
+    -------
+    tuple of int
+        Offset and size of the data chunk in bytes
+    """
+    wav_file.seek(0)
+    header = wav_file.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+        raise ValueError('Not a WAV file')
+    while True:
+        chunk_header = wav_file.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError('WAV file without data chunk')
+        chunk_size = int.from_bytes(chunk_header[4:], 'little')
+        if chunk_header[:4] == b'data':
+            data_offset = wav_file.tell()
+            wav_file.seek(0, os.SEEK_END)
+            return data_offset, min(chunk_size, wav_file.tell() - data_offset)
+        wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+@contextmanager
+def mapped_pcm_from_file(audio_path, audio_format=DEFAULT_FORMAT):
+    """
+    Provides the PCM data of an audio file (converted to audio_format, if required) as a memoryview.
+    Local WAV files are memory-mapped, so that the data does not get loaded into memory at once.
+    """
+    with AudioFile(audio_path, as_path=True, audio_format=audio_format) as wav_path:
+        if is_remote_path(wav_path):
+            with open_remote(wav_path, 'rb') as wav_file:
+                data_offset, data_size = get_wav_data_range(wav_file)
+                wav_file.seek(data_offset)
+                yield memoryview(wav_file.read(data_size))
+            return
+        with open(wav_path, 'rb') as wav_file:
+            data_offset, data_size = get_wav_data_range(wav_file)
+            if data_size == 0:
+                yield memoryview(b'')
+                return
+            mapped = mmap.mmap(wav_file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = memoryview(mapped)[data_offset:data_offset + data_size]
+            try:
+                yield data
+            finally:
+                data.release()
+                mapped.close()
 
 
 def pack_number(n, num_bytes):
@@ -305,12 +544,35 @@ def get_opus_frame_size(rate):
     return 60 * rate // 1000
 
 
+def get_opus_codec(kind, rate, channels):
+    """
+    Provides an Opus encoder ("encoder") or decoder ("decoder") for the given rate and number of channels.
+    Instances are cached per thread (and thereby per worker process) and reset to their initial state.
+    """
+    import opuslib  # pylint: disable=import-outside-toplevel
+    codecs = getattr(_opus_codecs, 'codecs', None)
+    if codecs is None:
+        codecs = _opus_codecs.codecs = {}
+    key = (kind, rate, channels)
+    codec = codecs.get(key)
+    if codec is None:
+        if kind == 'encoder':
+            codec = opuslib.Encoder(rate, channels, 'audio')
+        else:
+            codec = opuslib.Decoder(rate, channels)
+        codecs[key] = codec
+    else:
+        # Not using reset_state() of the codec classes, as the one of opuslib.Decoder is broken
+        api = opuslib.api.encoder if kind == 'encoder' else opuslib.api.decoder
+        api.ctl(codec._state, opuslib.api.ctl.reset_state)  # pylint: disable=protected-access
+    return codec
+
+
 def write_opus(opus_file, audio_data, audio_format=DEFAULT_FORMAT, bitrate=None):
     frame_size = get_opus_frame_size(audio_format.rate)
-    import opuslib  # pylint: disable=import-outside-toplevel
-    encoder = opuslib.Encoder(audio_format.rate, audio_format.channels, 'audio')
-    if bitrate is not None:
-        encoder.bitrate = bitrate
+    encoder = get_opus_codec('encoder', audio_format.rate, audio_format.channels)
+    # Bitrate is configuration (and no state) - so it has to be set on every use of a cached encoder
+    encoder.bitrate = OPUS_BITRATE_AUTO if bitrate is None else bitrate
     chunk_size = frame_size * audio_format.channels * audio_format.width
     opus_file.write(pack_number(len(audio_data), OPUS_PCM_LEN_SIZE))
     opus_file.write(pack_number(audio_format.rate, OPUS_RATE_SIZE))
@@ -335,19 +597,66 @@ def read_opus_header(opus_file):
     return pcm_buffer_size, AudioFormat(rate, channels, width)
 
 
-def read_opus(opus_file):
+def decode_opus_chunk(decoder, chunk, pcm, offset, max_frames, channels):
+    """
+    Decodes one Opus packet into the int16 array pcm, starting at value index offset.
+    At most max_frames frames (samples per channel) get written - pcm has to have room for them.
+    Returns the number of decoded frames.
+    """
+    import opuslib  # pylint: disable=import-outside-toplevel
+    state = getattr(decoder, '_state', None)
+    decode_into = getattr(opuslib.api.decoder, '_decode', None)
+    if state is None or decode_into is None:
+        # Falling back to the public (copying) API, if opuslib's internals are not the expected ones
+        decoded = np.frombuffer(decoder.decode(chunk, max_frames), dtype=np.int16)
+        pcm[offset:offset + len(decoded)] = decoded
+        return len(decoded) // channels
+    target = ctypes.cast(pcm.ctypes.data + offset * pcm.itemsize, opuslib.api.c_int16_pointer)
+    result = decode_into(state, chunk, len(chunk), target, max_frames, 0)
+    if result < 0:
+        raise opuslib.exceptions.OpusError(result)
+    return result
+
+
+def decode_opus(opus_file):
+    """
+    Decodes Opus data (as written by write_opus) into a NumPy array.
+
+    Returns
+    -------
+    tuple of AudioFormat, numpy.ndarray
+        Audio format and int16 array of interleaved samples. Its length is the one of the encoded PCM data,
+        but its underlying buffer could be larger, as every chunk gets decoded right into it.
+    """
     pcm_buffer_size, audio_format = read_opus_header(opus_file)
+    if audio_format.width != 2:
+        raise ValueError('Opus decoding only supports 16 bit samples')
     frame_size = get_opus_frame_size(audio_format.rate)
-    import opuslib  # pylint: disable=import-outside-toplevel
-    decoder = opuslib.Decoder(audio_format.rate, audio_format.channels)
-    audio_data = bytearray()
-    while len(audio_data) < pcm_buffer_size:
+    decoder = get_opus_codec('decoder', audio_format.rate, audio_format.channels)
+    num_values = pcm_buffer_size // audio_format.width
+    chunk_values = frame_size * audio_format.channels
+    # Room for whole chunks, so that the last one can also be decoded in place
+    pcm = np.empty(-(-num_values // chunk_values) * chunk_values, dtype=np.int16)
+    offset = 0
+    while offset < num_values:
+        # Packets that decode to less than a whole chunk (e.g. of other encoders) must not let later ones overflow
+        max_frames = min(frame_size, (len(pcm) - offset) // audio_format.channels)
+        if max_frames == 0:
+            raise ValueError('Opus decoding buffer is full before all announced samples got decoded')
         chunk_len = unpack_number(opus_file.read(OPUS_CHUNK_LEN_SIZE))
         chunk = opus_file.read(chunk_len)
-        decoded = decoder.decode(chunk, frame_size)
-        audio_data.extend(decoded)
-    audio_data = audio_data[:pcm_buffer_size]
-    return audio_format, bytes(audio_data)
+        if len(chunk) == 0:
+            raise ValueError('Opus data ends before all announced samples got decoded')
+        frames = decode_opus_chunk(decoder, chunk, pcm, offset, max_frames, audio_format.channels)
+        if frames == 0:
+            raise ValueError('Opus packet decoded to no samples')
+        offset += frames * audio_format.channels
+    return audio_format, pcm[:num_values]
+
+
+def read_opus(opus_file):
+    audio_format, pcm = decode_opus(opus_file)
+    return audio_format, pcm.tobytes()
 
 
 def read_ogg_opus(ogg_file):
@@ -582,20 +891,28 @@ def pcm_to_np(pcm_data, audio_format=DEFAULT_FORMAT):
     """
     Converts PCM data (e.g. read from a wavfile) into a mono numpy column vector
     with values in the range [0.0, 1.0].
+
+    Parameters
+    ----------
+    pcm_data : bytes or bytearray or memoryview or numpy.ndarray
+        Interleaved PCM samples - either as raw bytes or as array of the audio format's sample type
+    audio_format : util.audio.AudioFormat
     """
-    # Handles both mono and stero audio
     dtype = get_dtype(audio_format)
-    samples = np.frombuffer(pcm_data, dtype=dtype)
+    samples = pcm_data if isinstance(pcm_data, np.ndarray) else np.frombuffer(pcm_data, dtype=dtype)
+
+    # Convert to 0.0-1.0 range, scaling the only full-size float copy in place
+    samples = samples.astype(np.float32)
+    np.divide(samples, np.iinfo(dtype).max, out=samples)
 
-    # Read interleaved channels
+    # Mono clips already are the column vector
     nchannels = audio_format.channels
-    samples = samples.reshape((int(len(samples)/nchannels), nchannels))
-    
-    # Convert to 0.0-1.0 range
-    samples = samples.astype(np.float32) / np.iinfo(dtype).max
+    if nchannels == 1:
+        return samples.reshape((len(samples), 1))
 
-    # Average multi-channel clips into mono and turn into column vector
-    return np.expand_dims(np.mean(samples, axis=1), axis=1)
+    # Average interleaved multi-channel clips into mono and turn into column vector
+    samples = samples.reshape((len(samples) // nchannels, nchannels))
+    return np.mean(samples, axis=1, keepdims=True)
 
 
 def np_to_pcm(np_data, audio_format=DEFAULT_FORMAT):
@@ -6,12 +6,26 @@ import random
 import resampy
 import numpy as np
 
-from multiprocessing import Queue, Process
+from scipy.signal import firwin, lfilter, oaconvolve, resample_poly
+
+from functools import lru_cache, partial
+from multiprocessing import Queue, Process, RawArray
 from .audio import gain_db_to_ratio, max_dbfs, normalize_audio, AUDIO_TYPE_NP, AUDIO_TYPE_PCM, AUDIO_TYPE_OPUS
 from .helpers import LimitingPool, int_range, float_range, pick_value_from_range, tf_pick_value_from_range, MEGABYTE
 from .sample_collections import samples_from_source, unpack_maybe
 
 BUFFER_SIZE = 1 * MEGABYTE
+EXECUTOR_AUTO = 'auto'
+EXECUTOR_PROCESSES = 'processes'
+EXECUTOR_THREADS = 'threads'
+EXECUTORS = [EXECUTOR_AUTO, EXECUTOR_PROCESSES, EXECUTOR_THREADS]
+COMB_FILTER_MIN_BLOCK_SIZE = 128  # below this delay (in samples) IIR filtering beats adding up blocks
+# Resampling filter parameters roughly following resampy's "kaiser_fast" filter
+RESAMPLE_NUM_ZEROS = 24
+RESAMPLE_ROLLOFF = 0.868
+RESAMPLE_KAISER_BETA = 9.0
+RESAMPLE_MAX_FACTOR = 1000  # rate pairs with larger (reduced) factors get resampled by resampy
+OVERLAY_BANK_SEED = 0
 SPEC_PARSER = re.compile(r'^(?P<cls>[a-z_]+)(\[(?P<params>.*)\])?$')
 
 
@@ -137,28 +151,68 @@ def apply_graph_augmentations(domain, tensor, augmentations, transcript=None, cl
     return tensor
 
 
+class SharedAudioRing:
+    """Ring of fixed-size float32 slots in shared memory for passing NumPy audio of samples from worker processes
+    to the consuming process without pickling it. Has to be created before the worker processes get forked."""
+    def __init__(self, num_slots, slot_size):
+        """
+        Parameters
+        ----------
+        num_slots : int
+            Number of slots - has to exceed the number of samples that are in flight or held by the consumer
+        slot_size : int
+            Number of float32 values per slot - samples with more audio values get pickled as usual
+        """
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.buffer = RawArray('f', num_slots * slot_size)
+        self.slots = None
+
+    def get_slots(self):
+        if self.slots is None:
+            self.slots = np.frombuffer(self.buffer, dtype=np.float32).reshape(self.num_slots, self.slot_size)
+        return self.slots
+
+    def put(self, slot, sample):
+        """Moves the NumPy audio of a sample into a slot (if it fits) and returns the sample with its audio shape"""
+        if sample.audio_type != AUDIO_TYPE_NP or sample.audio.size > self.slot_size:
+            return sample, None
+        shape = sample.audio.shape
+        self.get_slots()[slot, :sample.audio.size] = sample.audio.ravel()
+        sample.audio = None
+        return sample, shape
+
+    def get(self, slot, shared_sample):
+        """Restores the audio of a sample passed by put as a view into its slot.
+        The view is only valid until the slot gets reused."""
+        sample, shape = shared_sample
+        if shape is not None:
+            sample.audio = self.get_slots()[slot, :int(np.prod(shape))].reshape(shape)
+        return sample
+
+
 class AugmentationContext:
-    def __init__(self, target_audio_type, augmentations):
+    def __init__(self, target_audio_type, augmentations, ring=None):
         self.target_audio_type = target_audio_type
         self.augmentations = augmentations
+        self.ring = ring
 
 
-AUGMENTATION_CONTEXT = None
+AUGMENTATION_CONTEXTS = None
 
 
-def _init_augmentation_worker(preparation_context):
-    global AUGMENTATION_CONTEXT  # pylint: disable=global-statement
-    AUGMENTATION_CONTEXT = preparation_context
+def _init_augmentation_worker(contexts):
+    global AUGMENTATION_CONTEXTS  # pylint: disable=global-statement
+    AUGMENTATION_CONTEXTS = contexts
 
 
-def _load_and_augment_sample(timed_sample, context=None):
+def _load_and_augment_sample(timed_sample, context):
     sample, clock = timed_sample
     realized_sample = unpack_maybe(sample)
     return _augment_sample((realized_sample, clock), context)
 
 
-def _augment_sample(timed_sample, context=None):
-    context = AUGMENTATION_CONTEXT if context is None else context
+def _augment_sample(timed_sample, context):
     sample, clock = timed_sample
     for augmentation in context.augmentations:
         if random.random() < augmentation.probability:
@@ -167,13 +221,118 @@ def _augment_sample(timed_sample, context=None):
     return sample
 
 
+def _process_sample(task, contexts=None):
+    contexts = AUGMENTATION_CONTEXTS if contexts is None else contexts
+    timed_sample, context_index, slot = task
+    context = contexts[context_index]
+    sample = _load_and_augment_sample(timed_sample, context)
+    return sample if slot is None else context.ring.put(slot, sample)
+
+
+class AugmentationPool:
+    """Pool of workers that load, augment and convert samples for apply_sample_augmentations.
+    It can serve any number of consecutive apply_sample_augmentations calls (like all training epochs
+    and dev and metrics iterations of a training run), so that workers and augmentations (e.g. Overlay's
+    enqueuing process) are only started once. They get started on entering the pool's context (or on first use),
+    so that a pool can be passed around (e.g. to dataset factories) before it is actually needed."""
+    def __init__(self,
+                 augmentations,
+                 audio_type=AUDIO_TYPE_NP,
+                 buffering=BUFFER_SIZE,
+                 process_ahead=None,
+                 shared_audio_slot_size=0,
+                 executor=EXECUTOR_AUTO):
+        """
+        Parameters
+        ----------
+        augmentations : list of augmentation class instances from util.augmentations.*.
+            Augmentations of which only the signal ones will get applied to samples of augmenting iterations
+        audio_type, buffering, process_ahead, shared_audio_slot_size, executor :
+            See apply_sample_augmentations.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError('Unknown executor "{}"'.format(executor))
+        self.augmentations = [aug for aug in augmentations if isinstance(aug, SampleAugmentation)] \
+            if augmentations else []
+        # Sample augmentations are stateful (e.g. Overlay's current noise sample) and not thread-safe,
+        # so they always get applied by worker processes that hold their own copies
+        self.use_threads = executor != EXECUTOR_PROCESSES and len(self.augmentations) == 0
+        self.audio_type = audio_type
+        self.buffering = buffering
+        self.process_ahead = os.cpu_count() if process_ahead is None else process_ahead
+        self.shared_audio_slot_size = shared_audio_slot_size
+        self.ring = None
+        self.process_fn = None
+        self.pool = None
+
+    def start(self):
+        """Starts augmentations and workers - if not already running"""
+        if self.pool is not None:
+            return
+        if not self.use_threads and self.shared_audio_slot_size > 0 and self.audio_type == AUDIO_TYPE_NP:
+            # Slots of samples in flight (at most process_ahead), of the sample held by the consumer and a spare one
+            self.ring = SharedAudioRing(self.process_ahead + 2, self.shared_audio_slot_size)
+        # Contexts of non-augmenting (index 0) and augmenting (index 1) iterations
+        contexts = (AugmentationContext(self.audio_type, [], ring=self.ring),
+                    AugmentationContext(self.audio_type, self.augmentations, ring=self.ring))
+        # Augmentations have to be started before workers get forked
+        for augmentation in self.augmentations:
+            augmentation.start(buffering=self.buffering)
+        if self.use_threads:
+            # Threads share the contexts - no worker initialization required
+            self.process_fn = partial(_process_sample, contexts=contexts)
+            self.pool = LimitingPool(process_ahead=self.process_ahead, use_threads=True)
+        else:
+            self.process_fn = _process_sample
+            self.pool = LimitingPool(process_ahead=self.process_ahead,
+                                     initializer=_init_augmentation_worker,
+                                     initargs=(contexts,))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def imap(self, timed_samples, augment=True):
+        """Loads, (optionally) augments and converts (sample, clock) tuples - see apply_sample_augmentations"""
+        self.start()
+        context_index = 1 if augment else 0
+        if self.ring is None:
+            yield from self.pool.imap(self.process_fn,
+                                      ((timed_sample, context_index, None) for timed_sample in timed_samples))
+        else:
+            tasks = ((timed_sample, context_index, index % self.ring.num_slots)
+                     for index, timed_sample in enumerate(timed_samples))
+            for index, shared_sample in enumerate(self.pool.imap(self.process_fn, tasks)):
+                yield self.ring.get(index % self.ring.num_slots, shared_sample)
+
+    def stats(self):
+        """Queue depth and waiting times of the workers (accumulated over all iterations) - see LimitingPool.stats"""
+        return self.pool.stats() if self.pool is not None else LimitingPool.empty_stats()
+
+    def close(self):
+        if self.pool is None:
+            return
+        # Workers could be blocked by augmentations (like Overlay waiting for its queue)
+        self.pool.terminate()
+        self.pool = None
+        self.ring = None
+        for augmentation in self.augmentations:
+            augmentation.stop()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def apply_sample_augmentations(samples,
                                augmentations,
                                audio_type=AUDIO_TYPE_NP,
                                buffering=BUFFER_SIZE,
                                process_ahead=None,
                                clock=0.0,
-                               final_clock=None):
+                               final_clock=None,
+                               shared_audio_slot_size=0,
+                               executor=EXECUTOR_AUTO,
+                               pool=None):
     """
     Prepares samples for being used during training.
     This includes parallel and buffered application of augmentations and a conversion to a specified audio-type.
@@ -195,6 +354,22 @@ def apply_sample_augmentations(samples,
     final_clock : float
         Final clock value between 0.0 and 1.0 for the last sample. Has to be >= than clock.
         Requires samples.__len__ attribute.
+    shared_audio_slot_size : int
+        If greater than 0 (and samples are processed by worker processes): Maximum number of float32 audio values
+        of a sample that workers pass back through a SharedAudioRing instead of pickling them.
+        Audio of such samples is a view into shared memory that is only valid until the next sample gets requested.
+        Only applies to audio_type util.audio.AUDIO_TYPE_NP.
+    executor : str
+        How samples are loaded, augmented and converted if process_ahead is not 0:
+        EXECUTOR_PROCESSES: By a pool of worker processes
+        EXECUTOR_THREADS: By a pool of threads - avoids forking and pickling for I/O bound work like loading
+        and decoding samples. Falls back to processes if there are sample augmentations to apply,
+        as they are not thread-safe.
+        EXECUTOR_AUTO: By threads if there are no sample augmentations to apply, otherwise by processes
+    pool : AugmentationPool
+        If provided (and process_ahead is not 0), samples are processed by this long-lived pool instead of a pool
+        that is only started for this call. Its own augmentations are applied if augmentations is non-empty.
+        Parameters audio_type, buffering, process_ahead, shared_audio_slot_size and executor are then ignored.
 
     Returns
     -------
@@ -214,21 +389,26 @@ def apply_sample_augmentations(samples,
         assert 0.0 <= final_clock <= 1.0
         assert clock <= final_clock
     augmentations = [aug for aug in augmentations if isinstance(aug, SampleAugmentation)] if augmentations else []
-    try:
-        for augmentation in augmentations:
-            augmentation.start(buffering=buffering)
+    if process_ahead == 0:
         context = AugmentationContext(audio_type, augmentations)
-        if process_ahead == 0:
+        try:
+            for augmentation in augmentations:
+                augmentation.start(buffering=buffering)
             for timed_sample in timed_samples():
-                yield _load_and_augment_sample(timed_sample, context=context)
-        else:
-            with LimitingPool(process_ahead=process_ahead,
-                              initializer=_init_augmentation_worker,
-                              initargs=(context,)) as pool:
-                yield from pool.imap(_load_and_augment_sample, timed_samples())
-    finally:
-        for augmentation in augmentations:
-            augmentation.stop()
+                yield _load_and_augment_sample(timed_sample, context)
+        finally:
+            for augmentation in augmentations:
+                augmentation.stop()
+    elif pool is not None:
+        yield from pool.imap(timed_samples(), augment=len(augmentations) > 0)
+    else:
+        with AugmentationPool(augmentations,
+                              audio_type=audio_type,
+                              buffering=buffering,
+                              process_ahead=process_ahead,
+                              shared_audio_slot_size=shared_audio_slot_size,
+                              executor=executor) as pool:
+            yield from pool.imap(timed_samples())
 
 
 def _enqueue_overlay_samples(sample_source, queue, buffering=BUFFER_SIZE):
@@ -246,22 +426,68 @@ def _enqueue_overlay_samples(sample_source, queue, buffering=BUFFER_SIZE):
 
 class Overlay(SampleAugmentation):
     """See "Overlay augmentation" in training documentation"""
-    def __init__(self, source, p=1.0, snr=3.0, layers=1):
+    def __init__(self, source, p=1.0, snr=3.0, layers=1, bank=0.0):
         super(Overlay, self).__init__(p)
         self.source = source
         self.snr = float_range(snr)
         self.layers = int_range(layers)
+        self.bank_duration = float(bank)
         self.current_sample = None
         self.queue = None
         self.enqueue_process = None
+        self.bank = None
+        self.bank_offsets = None
+        self.bank_rng = None
+        self.bank_rng_pid = None
 
     def start(self, buffering=BUFFER_SIZE):
+        if self.bank_duration > 0:
+            self._fill_bank(buffering=buffering)
+            return
         self.queue = Queue(max(1, math.floor(self.probability * self.layers[1] * os.cpu_count())))
         self.enqueue_process = Process(target=_enqueue_overlay_samples,
                                        args=(self.source, self.queue),
                                        kwargs={'buffering': buffering})
         self.enqueue_process.start()
 
+    def _fill_bank(self, buffering=BUFFER_SIZE):
+        # Decodes source samples once into a shared-memory buffer that (forked) workers can read from directly.
+        # Sources are ordered by duration, so samples are picked in (seeded) random order to not only get short ones.
+        samples = samples_from_source(self.source, buffering=buffering, labeled=False)
+        chunks = []
+        offsets = [0]
+        duration = 0.0
+        for index in np.random.RandomState(OVERLAY_BANK_SEED).permutation(len(samples)):
+            sample = unpack_maybe(samples[int(index)])
+            sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
+            rate = sample.audio_format.rate
+            # The last sample gets cut to the remaining duration
+            max_len = int(math.ceil((self.bank_duration - duration) * rate))
+            chunks.append(np.asarray(sample.audio, dtype=np.float32).reshape(-1)[:max_len])
+            offsets.append(offsets[-1] + len(chunks[-1]))
+            duration += len(chunks[-1]) / rate
+            if duration >= self.bank_duration:
+                break
+        if offsets[-1] == 0:
+            raise ValueError('Overlay source "{}" provides no audio'.format(self.source))
+        self.bank = RawArray('f', offsets[-1])
+        bank = np.frombuffer(self.bank, dtype=np.float32)
+        for chunk, offset in zip(chunks, offsets):
+            bank[offset:offset + len(chunk)] = chunk
+        self.bank_offsets = np.array(offsets[:-1], dtype=np.int64)
+
+    def _bank_slice(self, length):
+        # Random number generators are not to be shared with forked workers
+        if self.bank_rng_pid != os.getpid():
+            self.bank_rng = np.random.default_rng()
+            self.bank_rng_pid = os.getpid()
+        bank = np.frombuffer(self.bank, dtype=np.float32)
+        start = self.bank_offsets[self.bank_rng.integers(len(self.bank_offsets))]
+        if start + length <= len(bank):
+            return bank[start:start + length]
+        # Wrapping around the end of the bank (as often as required)
+        return np.take(bank, np.arange(start, start + length), mode='wrap')
+
     def apply(self, sample, clock=0.0):
         sample = unpack_maybe(sample)
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
@@ -269,6 +495,9 @@ class Overlay(SampleAugmentation):
         audio = sample.audio
         overlay_data = np.zeros_like(audio)
         for _ in range(n_layers):
+            if self.bank is not None:
+                overlay_data += self._bank_slice(len(audio)).reshape((len(audio),) + audio.shape[1:])
+                continue
             overlay_offset = 0
             while overlay_offset < len(audio):
                 if self.current_sample is None:
@@ -298,6 +527,8 @@ class Overlay(SampleAugmentation):
             self.enqueue_process = None
         self.current_sample = None
         self.queue = None
+        self.bank = None
+        self.bank_offsets = None
 
 
 class Codec(SampleAugmentation):
@@ -312,6 +543,25 @@ class Codec(SampleAugmentation):
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_OPUS, bitrate=bitrate)  # will get decoded again downstream
 
 
+def comb_filter(audio, n_delay, decay):
+    """
+    Feedback comb filter y[n] = x[n] + decay * y[n - n_delay] along the first axis of audio.
+    The signal gets reshaped into blocks of n_delay samples, so that the recursion runs from block to block.
+    For short delays (many blocks) it is computed by a first order IIR filter over all block positions at once,
+    otherwise by adding up whole blocks.
+    """
+    num_blocks = -(-len(audio) // n_delay)
+    padded = np.zeros((num_blocks * n_delay,) + audio.shape[1:], dtype=audio.dtype)
+    padded[:len(audio)] = audio
+    blocks = padded.reshape((num_blocks, n_delay) + audio.shape[1:])
+    if n_delay < COMB_FILTER_MIN_BLOCK_SIZE:
+        blocks = lfilter([1.0], [1.0, -decay], blocks, axis=0)
+    else:
+        for block_index in range(1, num_blocks):
+            blocks[block_index] += decay * blocks[block_index - 1]
+    return blocks.reshape(padded.shape)[:len(audio)]
+
+
 class Reverb(SampleAugmentation):
     """See "Reverb augmentation" in training documentation"""
     def __init__(self, p=1.0, delay=20.0, decay=10.0):
@@ -329,19 +579,47 @@ class Reverb(SampleAugmentation):
         result = np.copy(audio)
         primes = [17, 19, 23, 29, 31]
         for delay_prime in primes:  # primes to minimize comb filter interference
-            layer = np.copy(audio)
             n_delay = math.floor(delay * (delay_prime / primes[0]) * sample.audio_format.rate / 1000.0)
             n_delay = max(16, n_delay)  # 16 samples minimum to avoid performance trap and risk of division by zero
-            for w_index in range(0, math.floor(len(audio) / n_delay)):
-                w1 = w_index * n_delay
-                w2 = (w_index + 1) * n_delay
-                width = min(len(audio) - w2, n_delay)  # last window could be smaller
-                layer[w2:w2 + width] += decay * layer[w1:w1 + width]
-            result += layer
+            result += comb_filter(audio, n_delay, decay)
         audio = normalize_audio(result, dbfs=orig_dbfs)
         sample.audio = np.array(audio, dtype=np.float32)
 
 
+@lru_cache(maxsize=32)
+def polyphase_filter(up, down):
+    """Low-pass filter taps for resampling by a factor of up / down (cached per reduced rate pair)"""
+    max_factor = max(up, down)
+    return firwin(2 * RESAMPLE_NUM_ZEROS * max_factor + 1,
+                  RESAMPLE_ROLLOFF / max_factor,
+                  window=('kaiser', RESAMPLE_KAISER_BETA))
+
+
+@lru_cache(maxsize=32)
+def band_limit_filter(rate, band_rate):
+    """Low-pass filter taps that limit audio of sample rate rate to the band of sample rate band_rate"""
+    max_factor = rate / min(rate, band_rate)
+    return firwin(2 * math.ceil(RESAMPLE_NUM_ZEROS * max_factor) + 1,
+                  RESAMPLE_ROLLOFF / max_factor,
+                  window=('kaiser', RESAMPLE_KAISER_BETA))
+
+
+def resample(audio, src_rate, dst_rate):
+    """
+    Resamples audio along its first axis. Uses a polyphase filter with cached taps,
+    if the reduced ratio between the two sample rates allows it.
+    """
+    if src_rate == dst_rate:
+        return audio
+    divisor = math.gcd(int(src_rate), int(dst_rate))
+    up, down = int(dst_rate) // divisor, int(src_rate) // divisor
+    if max(up, down) > RESAMPLE_MAX_FACTOR:
+        return resampy.resample(audio, src_rate, dst_rate, axis=0, filter='kaiser_fast')
+    resampled = resample_poly(audio, up, down, axis=0, window=polyphase_filter(up, down))
+    # Same output length as resampy
+    return resampled[:int(len(audio) * up / down)].astype(audio.dtype, copy=False)
+
+
 class Resample(SampleAugmentation):
     """See "Resample augmentation" in training documentation"""
     def __init__(self, p=1.0, rate=8000):
@@ -351,9 +629,11 @@ class Resample(SampleAugmentation):
     def apply(self, sample, clock=0.0):
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
         rate = pick_value_from_range(self.rate, clock=clock)
-        orig_len = len(sample.audio)
-        resampled = resampy.resample(sample.audio, sample.audio_format.rate, rate, axis=0, filter='kaiser_fast')
-        sample.audio = resampy.resample(resampled, rate, sample.audio_format.rate, axis=0, filter='kaiser_fast')[:orig_len]
+        # Resampling down and back up again leaves just the band of the lower rate.
+        # So both steps are fused into a single band-limiting filter at the original rate.
+        taps = band_limit_filter(sample.audio_format.rate, rate)
+        taps = taps.reshape((len(taps),) + (1,) * (sample.audio.ndim - 1))
+        sample.audio = oaconvolve(sample.audio, taps, mode='same', axes=0).astype(sample.audio.dtype, copy=False)
 
 
 class NormalizeSampleRate(SampleAugmentation):
@@ -366,7 +646,7 @@ class NormalizeSampleRate(SampleAugmentation):
             return
 
         sample.change_audio_type(new_audio_type=AUDIO_TYPE_NP)
-        sample.audio = resampy.resample(sample.audio, sample.audio_format.rate, self.rate, axis=0, filter='kaiser_fast')
+        sample.audio = resample(sample.audio, sample.audio_format.rate, self.rate)
         sample.audio_format = sample.audio_format._replace(rate=self.rate)
 
 
@@ -8,7 +8,8 @@ Point this script to your transcripts, and it returns
 to the terminal the unique set of characters in those
 files (combined).
 
-These files are assumed to be csv, with the transcript being the third field.
+These files are assumed to be csv, with the transcript being the third field,
+or SDB files (.sdb), of which only the transcripts are read.
 
 The script simply reads all the text from all the files,
 storing a set of unique characters that were seen
@@ -20,6 +21,25 @@ import os
 import sys
 import unicodedata
 from .io import open_remote
+from .sample_collections import SDB
+
+def read_transcripts(in_file):
+    if in_file.lower().endswith(".sdb"):
+        sdb = SDB(in_file)
+        try:
+            yield from sdb.transcripts()
+        finally:
+            sdb.close()
+        return
+    with open_remote(in_file, "r") as csv_file:
+        reader = csv.reader(csv_file)
+        try:
+            next(reader, None)  # skip the file header (i.e. "transcript")
+            for row in reader:
+                yield row[2]
+        except IndexError:
+            print("Your input file", in_file, "is not formatted properly. Check if there are 3 columns with the 3rd containing the transcript")
+            sys.exit(-1)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -35,22 +55,13 @@ def main():
 
     all_text = set()
     for in_file in in_files:
-        with open_remote(in_file, "r") as csv_file:
-            reader = csv.reader(csv_file)
-            try:
-                next(reader, None)  # skip the file header (i.e. "transcript")
-                for row in reader:
-                    if not args.disable_unicode_variants:
-                        unicode_transcript = unicodedata.normalize("NFKC", row[2])
-                        if row[2] != unicode_transcript:
-                            print("Your input file", in_file, "contains at least one transript with unicode chars on more than one code-point: '{}'. Consider using NFKC normalization: unicodedata.normalize('NFKC', str).".format(row[2]))
-                            sys.exit(-1)
-                    all_text |= set(row[2])
-            except IndexError:
-                print("Your input file", in_file, "is not formatted properly. Check if there are 3 columns with the 3rd containing the transcript")
-                sys.exit(-1)
-            finally:
-                csv_file.close()
+        for transcript in read_transcripts(in_file):
+            if not args.disable_unicode_variants:
+                unicode_transcript = unicodedata.normalize("NFKC", transcript)
+                if transcript != unicode_transcript:
+                    print("Your input file", in_file, "contains at least one transript with unicode chars on more than one code-point: '{}'. Consider using NFKC normalization: unicodedata.normalize('NFKC', str).".format(transcript))
+                    sys.exit(-1)
+            all_text |= set(transcript)
 
     print("### The following unique characters were found in your transcripts: ###")
     if args.alphabet_format:
@@ -11,9 +11,9 @@ from ds_ctcdecoder import Alphabet, UTF8Alphabet
 from .flags import FLAGS
 from .gpu import get_available_gpus
 from .logging import log_error, log_warn
-from .helpers import parse_file_size
-from .augmentations import parse_augmentations, NormalizeSampleRate
-from .io import path_exists_remote
+from .helpers import parse_file_size, bucket_frame_boundaries
+from .augmentations import parse_augmentations, NormalizeSampleRate, EXECUTORS, EXECUTOR_AUTO
+from .io import path_exists_remote, enable_remote_cache
 
 class ConfigSingleton:
     _config = None
@@ -48,6 +48,10 @@ def initialize_globals():
     # Read-buffer
     FLAGS.read_buffer = parse_file_size(FLAGS.read_buffer)
 
+    # Remote file cache
+    if FLAGS.remote_cache_dir:
+        enable_remote_cache(FLAGS.remote_cache_dir, parse_file_size(FLAGS.remote_cache_size))
+
     # Set default dropout rates
     if FLAGS.dropout_rate2 < 0:
         FLAGS.dropout_rate2 = FLAGS.dropout_rate
@@ -66,6 +70,9 @@ def initialize_globals():
     if FLAGS.load_evaluate not in ['last', 'best', 'auto']:
         FLAGS.load_evaluate = 'auto'
 
+    if FLAGS.loading_executor not in EXECUTORS:
+        FLAGS.loading_executor = EXECUTOR_AUTO
+
     # Set default summary dir
     if not FLAGS.summary_dir:
         FLAGS.summary_dir = xdg.save_data_path(os.path.join('deepspeech', 'summaries'))
@@ -162,6 +169,32 @@ def initialize_globals():
 
     c.audio_step_samples = FLAGS.audio_sample_rate * (FLAGS.feature_win_step / 1000)
 
+    # Duration buckets for batching training samples
+    try:
+        c.bucket_boundaries = [float(b) for b in FLAGS.bucket_boundaries.split(',') if b.strip()]
+    except ValueError:
+        c.bucket_boundaries = None
+    if c.bucket_boundaries is None or any(b <= 0 for b in c.bucket_boundaries) or \
+            c.bucket_boundaries != sorted(set(c.bucket_boundaries)):
+        log_error('--bucket_boundaries has to be a comma separated list of strictly ascending positive durations '
+                  'in seconds.')
+        sys.exit(1)
+    # Buckets are formed on feature frames, so boundaries have to be at least one feature step apart
+    try:
+        bucket_frame_boundaries(c.bucket_boundaries, FLAGS.audio_sample_rate, c.audio_step_samples)
+    except ValueError:
+        log_error('--bucket_boundaries have to be at least one feature step (--feature_win_step = {} ms) long and '
+                  'apart from each other.'.format(FLAGS.feature_win_step))
+        sys.exit(1)
+
+    if FLAGS.train_frame_budget > 0 and not c.bucket_boundaries:
+        log_error('--train_frame_budget requires --bucket_boundaries.')
+        sys.exit(1)
+
+    if FLAGS.batch_shuffle_buffer < 0:
+        log_error('--batch_shuffle_buffer must not be negative.')
+        sys.exit(1)
+
     if FLAGS.one_shot_infer:
         if not path_exists_remote(FLAGS.one_shot_infer):
             log_error('Path specified in --one_shot_infer is not a valid file.')
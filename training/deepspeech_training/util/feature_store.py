@@ -0,0 +1,148 @@
+"""
+Feature stores hold pre-computed MFCC features of a sample set, so that training and evaluation can skip
+audio decoding and feature computation. A feature store is a directory with the following files:
+
+- features.npy: float32 array of shape (total number of feature frames, number of MFCC coefficients)
+  that contains the features of all samples one after another and gets memory-mapped when reading
+- offsets.npy: int64 array of length number of samples + 1 with the first frame of each sample
+- index.json: feature configuration, audio sources and ids and transcripts of all samples
+"""
+import os
+import json
+import shutil
+
+import numpy as np
+
+FEATURES_FILE = 'features.npy'
+OFFSETS_FILE = 'offsets.npy'
+INDEX_FILE = 'index.json'
+FEATURES_DTYPE = np.float32
+
+
+def is_feature_store(path):
+    """Returns True iff the path is a directory that contains a feature store index."""
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+class FeatureStoreWriter:
+    """Writes a feature store directory. Samples have to be added in the order they should be read later."""
+    def __init__(self, store_dir, config, sources=None):
+        """
+        Parameters
+        ----------
+        store_dir : str
+            Path of the feature store directory to create (it must not contain another feature store)
+        config : dict
+            Feature configuration (see feeding.feature_config) that readers have to match
+        sources : list of str or None
+            Paths of the audio sample sets the features got computed from
+        """
+        if is_feature_store(store_dir):
+            raise ValueError('There is already a feature store in "{}"'.format(store_dir))
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.config = dict(config)
+        self.sources = list(sources or [])
+        self.sample_ids = []
+        self.transcripts = []
+        self.offsets = [0]
+        self.num_coefficients = None
+        self.data_path = os.path.join(store_dir, FEATURES_FILE + '.tmp')
+        self.data_file = open(self.data_path, 'wb')
+
+    def add(self, sample_id, features, transcript=None):
+        """
+        Adds the features of one sample.
+
+        Parameters
+        ----------
+        sample_id : str
+            Id of the sample
+        features : numpy.ndarray
+            Features of shape (number of frames, number of MFCC coefficients)
+        transcript : str or None
+            Transcript of the sample
+        """
+        features = np.asarray(features, dtype=FEATURES_DTYPE)
+        if features.ndim != 2 or (self.num_coefficients is not None and features.shape[1] != self.num_coefficients):
+            raise ValueError('Features of sample "{}" have unexpected shape {}'.format(sample_id, features.shape))
+        self.num_coefficients = features.shape[1]
+        self.data_file.write(np.ascontiguousarray(features).tobytes())
+        self.sample_ids.append(sample_id)
+        self.transcripts.append(transcript)
+        self.offsets.append(self.offsets[-1] + len(features))
+
+    def close(self):
+        if self.data_file is None:
+            return
+        self.data_file.close()
+        self.data_file = None
+        shape = (self.offsets[-1], self.num_coefficients or self.config.get('n_input', 0))
+        with open(os.path.join(self.store_dir, FEATURES_FILE), 'wb') as features_file:
+            np.lib.format.write_array_header_1_0(features_file, {'descr': np.lib.format.dtype_to_descr(
+                np.dtype(FEATURES_DTYPE)), 'fortran_order': False, 'shape': shape})
+            with open(self.data_path, 'rb') as data_file:
+                shutil.copyfileobj(data_file, features_file)
+        os.remove(self.data_path)
+        np.save(os.path.join(self.store_dir, OFFSETS_FILE), np.array(self.offsets, dtype=np.int64))
+        # The index gets written last, as its existence marks the store as complete
+        with open(os.path.join(self.store_dir, INDEX_FILE), 'w') as index_file:
+            json.dump({'config': self.config,
+                       'sources': self.sources,
+                       'sample_ids': self.sample_ids,
+                       'transcripts': self.transcripts}, index_file)
+
+    def __len__(self):
+        return len(self.sample_ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FeatureStore:
+    """Read-only access to the memory-mapped features of a feature store directory"""
+    def __init__(self, store_dir, config=None):
+        """
+        Parameters
+        ----------
+        store_dir : str
+            Path of the feature store directory
+        config : dict or None
+            If not None, feature configuration the store has to have been computed with
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_FILE), 'r') as index_file:
+            index = json.load(index_file)
+        self.config = index['config']
+        if config is not None and not self.matches(config):
+            raise ValueError('Feature store "{}" got computed with feature configuration {}, which differs from the '
+                             'current one {} - please re-compute it'.format(store_dir, self.config, dict(config)))
+        self.sources = index['sources']
+        self.sample_ids = index['sample_ids']
+        self.transcripts = index['transcripts']
+        self.features = np.load(os.path.join(store_dir, FEATURES_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(store_dir, OFFSETS_FILE))
+        self.id_index = None
+
+    def matches(self, config):
+        """Returns True iff the store got computed with the passed feature configuration."""
+        return self.config == json.loads(json.dumps(dict(config)))
+
+    def get(self, i):
+        """Returns the (memory-mapped) features of the i-th sample."""
+        return self.features[self.offsets[i]:self.offsets[i + 1]]
+
+    def index_of(self, sample_id):
+        """Returns the index of the sample with the given id."""
+        if self.id_index is None:
+            self.id_index = {sample_id: i for i, sample_id in enumerate(self.sample_ids)}
+        return self.id_index[sample_id]
+
+    def __getitem__(self, sample_id):
+        return self.get(self.index_of(sample_id))
+
+    def __len__(self):
+        return len(self.sample_ids)
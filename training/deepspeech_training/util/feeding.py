@@ -12,10 +12,12 @@ from tensorflow.python.ops import gen_audio_ops as contrib_audio
 from .config import Config
 from .text import text_to_char_array
 from .flags import FLAGS
-from .augmentations import apply_sample_augmentations, apply_graph_augmentations
-from .audio import read_frames_from_file, vad_split, pcm_to_np, DEFAULT_FORMAT
-from .sample_collections import samples_from_sources
-from .helpers import remember_exception, MEGABYTE
+from .augmentations import apply_sample_augmentations, apply_graph_augmentations, GraphAugmentation, \
+    NormalizeSampleRate
+from .audio import mapped_pcm_from_file, vad_split_pcm, pcm_to_np, DEFAULT_FORMAT
+from .sample_collections import samples_from_sources, SHARDED_SDB_EXTENSION
+from .feature_store import FeatureStore, is_feature_store
+from .helpers import remember_exception, bucket_frame_boundaries, Interleaved, LenMap, MEGABYTE
 
 
 def audio_to_features(audio, sample_rate, transcript=None, clock=0.0, train_phase=False, augmentations=None, sample_id=None):
@@ -84,6 +86,74 @@ def to_sparse_tuple(sequence):
     return indices, sequence, shape
 
 
+def stored_features_to_features(sample_id, features, transcript, clock, train_phase=False, augmentations=None):
+    sparse_transcript = tf.SparseTensor(*transcript)
+    features = tf.reshape(features, [-1, Config.n_input])
+    if train_phase and augmentations:
+        features = apply_graph_augmentations('features', features, augmentations,
+                                             transcript=sparse_transcript, clock=clock)
+    return sample_id, features, tf.shape(input=features)[0], sparse_transcript
+
+
+def feature_config():
+    """Returns the current feature configuration that pre-computed features have to match."""
+    return {'audio_sample_rate': FLAGS.audio_sample_rate,
+            'feature_win_len': FLAGS.feature_win_len,
+            'feature_win_step': FLAGS.feature_win_step,
+            'n_input': Config.n_input}
+
+
+def needs_audio(augmentations):
+    """
+    Returns True iff some of the augmentations have to be applied before features get computed.
+    Sample rate normalization is not counted, as it is already applied when pre-computing features.
+    """
+    for augmentation in augmentations or []:
+        if isinstance(augmentation, GraphAugmentation):
+            if augmentation.domain != 'features':
+                return True
+        elif not isinstance(augmentation, NormalizeSampleRate):
+            return True
+    return False
+
+
+def bucket_batch_sizes(bucket_boundaries, batch_size, frame_budget=0):
+    """
+    Computes the feature-frame boundaries and batch sizes of duration buckets.
+
+    Parameters
+    ----------
+    bucket_boundaries : list of float
+        Ascending bucket boundaries as sample durations in seconds
+    batch_size : int
+        Number of samples per batch, if no frame budget is given
+    frame_budget : int
+        If greater than 0, the maximum total number of feature frames per batch.
+        The batch size of a bucket is then the budget divided by the bucket's upper boundary.
+        Samples beyond the last boundary are batched one at a time.
+
+    Returns
+    -------
+    tuple of list of int, list of int
+        Bucket boundaries in feature frames and the batch sizes of all len(bucket_boundaries) + 1 buckets
+    """
+    frame_boundaries = bucket_frame_boundaries(bucket_boundaries, FLAGS.audio_sample_rate, Config.audio_step_samples)
+    if frame_budget > 0:
+        batch_sizes = [max(1, frame_budget // boundary) for boundary in frame_boundaries] + [1]
+    else:
+        batch_sizes = [batch_size] * (len(frame_boundaries) + 1)
+    return frame_boundaries, batch_sizes
+
+
+def bucket_key_fn(boundaries, sample_id, features, features_len, transcript):  # pylint: disable=unused-argument
+    """
+    Bucket index of a sample - the index of the first frame boundary that is greater than its number of frames.
+    Applied to a batch of (padded) sample lengths, it returns one bucket index per sample.
+    """
+    reached = tf.greater_equal(tf.expand_dims(features_len, -1), tf.constant(boundaries, dtype=tf.int32))
+    return tf.reduce_sum(tf.cast(reached, tf.int64), axis=-1)
+
+
 def create_dataset(sources,
                    batch_size,
                    epochs=1,
@@ -95,30 +165,92 @@ def create_dataset(sources,
                    exception_box=None,
                    process_ahead=None,
                    buffering=1 * MEGABYTE,
+                   memory_map=False,
+                   read_ahead=0,
+                   shared_audio_slot=0.0,
+                   loading_executor='auto',
+                   augmentation_pool=None,
+                   bucket_boundaries=None,
+                   batch_shuffle_buffer=0,
+                   frame_budget=0,
                    split_dataset=False):
     epoch_counter = Counter()  # survives restarts of the dataset and its generator
 
+    stores = None
+    if any(map(is_feature_store, sources)):
+        if not all(map(is_feature_store, sources)):
+            raise ValueError('Feature stores cannot be mixed with other sample sources')
+        if needs_audio(augmentations):
+            # Features have to be computed from augmented audio - so we go back to the audio sources of the stores
+            sources = [source for store in sources for source in FeatureStore(store).sources]
+        else:
+            # Opened (and checked against the feature configuration) once for all epochs - before TF pulls any data
+            stores = [FeatureStore(source, config=feature_config()) for source in sources]
+
+    partition = None
+    if split_dataset:
+        import horovod.tensorflow as hvd
+        # Sharded SDB sources allow every rank to just read its own part of the samples (and shard files)
+        if all(source.lower().endswith(SHARDED_SDB_EXTENSION) for source in sources):
+            partition = (hvd.size(), hvd.rank())
+
     def generate_values():
         epoch = epoch_counter['epoch']
         if train_phase:
             epoch_counter['epoch'] += 1
-        samples = samples_from_sources(sources, buffering=buffering, labeled=True, reverse=reverse)
+        samples = samples_from_sources(sources,
+                                       buffering=buffering,
+                                       labeled=True,
+                                       reverse=reverse,
+                                       memory_map=memory_map,
+                                       partition=partition,
+                                       read_ahead=read_ahead)
         num_samples = len(samples)
         if limit > 0:
-            num_samples = min(limit, num_samples)
+            partition_limit = limit if partition is None else len(range(partition[1], limit, partition[0]))
+            num_samples = min(partition_limit, num_samples)
         samples = apply_sample_augmentations(samples,
                                              augmentations,
                                              buffering=buffering,
                                              process_ahead=2 * batch_size if process_ahead is None else process_ahead,
                                              clock=epoch / epochs,
-                                             final_clock=(epoch + 1) / epochs)
+                                             final_clock=(epoch + 1) / epochs,
+                                             shared_audio_slot_size=int(shared_audio_slot * FLAGS.audio_sample_rate),
+                                             executor=loading_executor,
+                                             pool=augmentation_pool)
         for sample_index, sample in enumerate(samples):
             if sample_index >= num_samples:
                 break
             clock = (epoch * num_samples + sample_index) / (epochs * num_samples) if train_phase and epochs > 0 else 0.0
             transcript = text_to_char_array(sample.transcript, Config.alphabet, context=sample.sample_id)
             transcript = to_sparse_tuple(transcript)
-            yield sample.sample_id, sample.audio, sample.audio_format.rate, transcript, clock
+            audio = sample.audio
+            if shared_audio_slot > 0:
+                # Audio could be a view into a shared-memory slot that gets reused once the next sample is requested
+                audio = np.array(audio)
+            yield sample.sample_id, audio, sample.audio_format.rate, transcript, clock
+
+    def generate_stored_values():
+        epoch = epoch_counter['epoch']
+        if train_phase:
+            epoch_counter['epoch'] += 1
+
+        def store_entry(store, i):
+            return store, i, store.offsets[i + 1] - store.offsets[i]
+
+        entries = Interleaved(*[LenMap(partial(store_entry, store),
+                                       range(len(store) - 1, -1, -1) if reverse else range(len(store)))
+                                for store in stores],
+                              key=lambda entry: entry[2],
+                              reverse=reverse)
+        num_samples = len(entries) if limit <= 0 else min(limit, len(entries))
+        for sample_index, (store, i, _) in enumerate(entries):
+            if sample_index >= num_samples:
+                break
+            clock = (epoch * num_samples + sample_index) / (epochs * num_samples) if train_phase and epochs > 0 else 0.0
+            sample_id = store.sample_ids[i]
+            transcript = text_to_char_array(store.transcripts[i], Config.alphabet, context=sample_id)
+            yield sample_id, np.array(store.get(i)), to_sparse_tuple(transcript), clock
 
     # Batching a dataset of 2D SparseTensors creates 3D batches, which fail
     # when passed to tf.nn.ctc_loss, so we reshape them to remove the extra
@@ -127,27 +259,58 @@ def create_dataset(sources,
         shape = sparse.dense_shape
         return tf.sparse.reshape(sparse, [shape[0], shape[2]])
 
-    def batch_fn(sample_ids, features, features_len, transcripts):
+    def batch_fn(sample_ids, features, features_len, transcripts, size=batch_size):
         features = tf.data.Dataset.zip((features, features_len))
-        features = features.padded_batch(batch_size, padded_shapes=([None, Config.n_input], []))
-        transcripts = transcripts.batch(batch_size).map(sparse_reshape)
-        sample_ids = sample_ids.batch(batch_size)
+        features = features.padded_batch(size, padded_shapes=([None, Config.n_input], []))
+        transcripts = transcripts.batch(size).map(sparse_reshape)
+        sample_ids = sample_ids.batch(size)
         return tf.data.Dataset.zip((sample_ids, features, transcripts))
 
-    process_fn = partial(entry_to_features, train_phase=train_phase, augmentations=augmentations)
+    def sample_component(index, *sample):
+        return sample[index]
 
-    dataset = tf.data.Dataset.from_generator(remember_exception(generate_values, exception_box),
-                                             output_types=(tf.string, tf.float32, tf.int32,
-                                                           (tf.int64, tf.int32, tf.int64), tf.float64))
-    if split_dataset:
+    def bucket_batch_size(batch_sizes, key):
+        return tf.gather(tf.constant(batch_sizes, dtype=tf.int64), key)
+
+    def bucket_batch_fn(batch_sizes, key, window):
+        # group_by_window provides a dataset of sample tuples, batch_fn expects one dataset per component
+        return batch_fn(*[window.map(partial(sample_component, index)) for index in range(4)],
+                        size=bucket_batch_size(batch_sizes, key))
+
+    def is_full_batch(sample_ids, features, transcripts):
+        return tf.equal(tf.size(sample_ids), batch_size)
+
+    if stores is not None:
+        process_fn = partial(stored_features_to_features, train_phase=train_phase, augmentations=augmentations)
+        dataset = tf.data.Dataset.from_generator(remember_exception(generate_stored_values, exception_box),
+                                                 output_types=(tf.string, tf.float32,
+                                                               (tf.int64, tf.int32, tf.int64), tf.float64))
+    else:
+        process_fn = partial(entry_to_features, train_phase=train_phase, augmentations=augmentations)
+        dataset = tf.data.Dataset.from_generator(remember_exception(generate_values, exception_box),
+                                                 output_types=(tf.string, tf.float32, tf.int32,
+                                                               (tf.int64, tf.int32, tf.int64), tf.float64))
+    if split_dataset and partition is None:
         # Using horovod Iterator.get_next() is not aware of different devices.
         # A.shard(n, i) will contain all elements of A whose index mod n = i.
-        import horovod.tensorflow as hvd
         dataset = dataset.shard(hvd.size(), hvd.rank())
     dataset = dataset.map(process_fn, num_parallel_calls=tf.data.experimental.AUTOTUNE)
     if cache_path:
         dataset = dataset.cache(cache_path)
-    dataset = (dataset.window(batch_size, drop_remainder=train_phase).flat_map(batch_fn))
+    if bucket_boundaries:
+        # Batching only samples of similar duration keeps padding low, even if the samples are not globally sorted
+        frame_boundaries, batch_sizes = bucket_batch_sizes(bucket_boundaries, batch_size, frame_budget=frame_budget)
+        dataset = dataset.apply(tf.data.experimental.group_by_window(
+            partial(bucket_key_fn, frame_boundaries),
+            partial(bucket_batch_fn, batch_sizes),
+            window_size_func=partial(bucket_batch_size, batch_sizes)))
+        if train_phase and frame_budget == 0:
+            # Remaining partial batches of a frame budget are still within budget and thus kept
+            dataset = dataset.filter(is_full_batch)
+    else:
+        dataset = (dataset.window(batch_size, drop_remainder=train_phase).flat_map(batch_fn))
+    if batch_shuffle_buffer > 0:
+        dataset = dataset.shuffle(batch_shuffle_buffer)
     if split_dataset:
         #TODO is there a way to get a proper value?
         dataset = dataset.prefetch(2)
@@ -163,12 +326,14 @@ def split_audio_file(audio_path,
                      outlier_batch_size=1,
                      exception_box=None):
     def generate_values():
-        frames = read_frames_from_file(audio_path)
-        segments = vad_split(frames, aggressiveness=aggressiveness)
-        for segment in segments:
-            segment_buffer, time_start, time_end = segment
-            samples = pcm_to_np(segment_buffer, audio_format)
-            yield time_start, time_end, samples
+        with mapped_pcm_from_file(audio_path, audio_format=audio_format) as pcm_data:
+            for segment_buffer, time_start, time_end in vad_split_pcm(pcm_data,
+                                                                      audio_format=audio_format,
+                                                                      aggressiveness=aggressiveness):
+                samples = pcm_to_np(segment_buffer, audio_format)
+                # Releasing the slice right away, as the mapped file can only be closed without remaining views
+                segment_buffer.release()
+                yield time_start, time_end, samples
 
     def to_mfccs(time_start, time_end, samples):
         features, features_len = audio_to_features(samples, audio_format.rate)
@@ -189,3 +354,58 @@ def split_audio_file(audio_path,
     dataset = nds.concatenate(ods)
     dataset = dataset.prefetch(Config.num_devices)
     return dataset
+
+
+def split_audio_files(audio_paths,
+                      audio_format=DEFAULT_FORMAT,
+                      batch_size=1,
+                      aggressiveness=3,
+                      outlier_duration_ms=10000,
+                      outlier_batch_size=1,
+                      file_done_callback=None,
+                      exception_box=None):
+    """
+    Like split_audio_file, but pipelines the VAD segments of many audio files into shared batches.
+    Batch elements are prefixed by the index of the file they were taken from.
+    Once all segments of a file got passed on, file_done_callback (if provided)
+    gets called with the file's index and its number of segments.
+    """
+    def generate_values():
+        for file_index, audio_path in enumerate(audio_paths):
+            num_segments = 0
+            with mapped_pcm_from_file(audio_path, audio_format=audio_format) as pcm_data:
+                for segment_buffer, time_start, time_end in vad_split_pcm(pcm_data,
+                                                                          audio_format=audio_format,
+                                                                          aggressiveness=aggressiveness):
+                    samples = pcm_to_np(segment_buffer, audio_format)
+                    segment_buffer.release()
+                    num_segments += 1
+                    yield file_index, time_start, time_end, samples
+            if file_done_callback is not None:
+                file_done_callback(file_index, num_segments)
+
+    def to_mfccs(file_index, time_start, time_end, samples):
+        features, features_len = audio_to_features(samples, audio_format.rate)
+        return file_index, time_start, time_end, features, features_len
+
+    def is_outlier(file_index, time_start, time_end, features, features_len):
+        return tf.cast(time_end - time_start > int(outlier_duration_ms), tf.int64)
+
+    def outlier_aware_batch_size(key):
+        return tf.where(tf.equal(key, 1),
+                        tf.constant(outlier_batch_size, dtype=tf.int64),
+                        tf.constant(batch_size, dtype=tf.int64))
+
+    def batch_segments(key, segments):
+        return segments.padded_batch(outlier_aware_batch_size(key),
+                                     padded_shapes=([], [], [], [None, Config.n_input], []))
+
+    dataset = (tf.data.Dataset
+               .from_generator(remember_exception(generate_values, exception_box),
+                               output_types=(tf.int32, tf.int32, tf.int32, tf.float32))
+               .map(to_mfccs, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+               .apply(tf.data.experimental.group_by_window(is_outlier,
+                                                           batch_segments,
+                                                           window_size_func=outlier_aware_batch_size)))
+    dataset = dataset.prefetch(Config.num_devices)
+    return dataset
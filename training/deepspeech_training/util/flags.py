@@ -18,6 +18,12 @@ def create_flags():
     f.DEFINE_string('metrics_files', '', 'comma separated list of files specifying the datasets used for tracking of metrics (after validation step). Currently the only metric is the CTC loss but without affecting the tracking of best validation loss. Multiple files will get reported separately. If empty, metrics will not be computed.')
 
     f.DEFINE_string('read_buffer', '1MB', 'buffer-size for reading samples from datasets (supports file-size suffixes KB, MB, GB, TB)')
+    f.DEFINE_boolean('read_memory_map', False, 'memory-map local SDB files instead of reading them through --read_buffer - sample audio is then decoded straight from the mapped pages (only getting copied when passed to worker processes) and these pages are shared by all processes reading the same file')
+    f.DEFINE_integer('read_ahead', 0, 'number of sample files (of CSV sources) to read ahead in parallel by I/O threads - hides the latency of remote storage like gs:// or hdfs://, 0 for loading files within the sample processing workers')
+    f.DEFINE_string('remote_cache_dir', '', 'local directory for caching sample files of remote (gs://, hdfs://...) CSV sources - files are then only downloaded once and following epochs read the local copies - if empty, caching is disabled')
+    f.DEFINE_string('remote_cache_size', '100GB', 'size cap of --remote_cache_dir - least recently used files get evicted when exceeded (supports file-size suffixes KB, MB, GB, TB)')
+    f.DEFINE_float('shared_audio_slot', 0.0, 'maximum duration (in seconds) of augmented sample audio that sample processing workers pass back through shared memory instead of pickling it - longer samples fall back to pickling, 0 disables shared memory transport')
+    f.DEFINE_string('loading_executor', 'auto', 'how samples are loaded and augmented: "processes" for a pool of worker processes, "threads" for a pool of threads (avoids forking and pickling for I/O bound loading and decoding - only applies to sample sets without sample augmentations, as these are not thread-safe and always get applied by processes), "auto" for threads if no sample augmentations are to be applied (e.g. dev and test sets) and processes otherwise')
     f.DEFINE_string('feature_cache', '', 'cache MFCC features to disk to speed up future training runs on the same data. This flag specifies the path where cached features extracted from --train_files will be saved. If empty, or if online augmentation flags are enabled, caching will be disabled.')
     f.DEFINE_integer('cache_for_epochs', 0, 'after how many epochs the feature cache is invalidated again - 0 for "never"')
 
@@ -60,6 +66,10 @@ def create_flags():
 
     f.DEFINE_integer('export_batch_size', 1, 'number of elements per batch on the exported graph')
 
+    f.DEFINE_string('bucket_boundaries', '', 'comma separated list of ascending sample durations in seconds - if set, training samples get grouped into duration buckets between these boundaries and every training batch is formed from samples of just one bucket')
+    f.DEFINE_integer('train_frame_budget', 0, 'maximum total number of feature frames per training batch - if greater than 0, the batch size of every duration bucket (see --bucket_boundaries) is this budget divided by the bucket\'s upper boundary in frames, replacing --train_batch_size')
+    f.DEFINE_integer('batch_shuffle_buffer', 0, 'number of training batches to shuffle at a time (e.g. to randomize the order of duration buckets) - 0 means no shuffling')
+
     # Performance
 
     f.DEFINE_integer('inter_op_parallelism_threads', 0, 'number of inter-op parallelism threads - see tf.ConfigProto for more details. USE OF THIS FLAG IS UNSUPPORTED')
@@ -5,8 +5,11 @@ import heapq
 import semver
 import random
 
+from threading import Condition
 from multiprocessing import Pool
-from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
 
 KILO = 1024
 KILOBYTE = 1 * KILO
@@ -39,6 +42,15 @@ def secs_to_hours(secs):
     return '%d:%02d:%02d' % (hours, minutes, seconds)
 
 
+def bucket_frame_boundaries(bucket_boundaries, sample_rate, step_samples):
+    """Converts bucket boundaries from seconds to feature frames, making sure they are at least one frame apart"""
+    frame_boundaries = [int(seconds * sample_rate / step_samples) for seconds in bucket_boundaries]
+    if any(boundary < 1 for boundary in frame_boundaries) or frame_boundaries != sorted(set(frame_boundaries)):
+        raise ValueError('Bucket boundaries {} have to be strictly ascending and at least one feature step apart '
+                         '(resulting in {} feature frames)'.format(bucket_boundaries, frame_boundaries))
+    return frame_boundaries
+
+
 def check_ctcdecoder_version():
     ds_version_s = open(os.path.join(os.path.dirname(__file__), '../VERSION')).read().strip()
 
@@ -104,35 +116,138 @@ class LenMap:
         return self.length
 
 
+def prefetch(fn, iterable, ahead):
+    """Lazily maps fn over iterable (preserving order) using a pool of threads that keeps up to `ahead` calls
+    in flight. Intended for latency-bound I/O (like reading remote files), where it bounds memory to `ahead` results."""
+    with ThreadPoolExecutor(max_workers=ahead) as executor:
+        pending = deque()
+        try:
+            for item in iterable:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= ahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class _Feed:
+    """State of feeding items of one LimitingPool.imap iteration"""
+    __slots__ = ('processed', 'stopped')
+
+    def __init__(self):
+        self.processed = 0
+        self.stopped = False
+
+
 class LimitingPool:
     """Limits unbound ahead-processing of multiprocessing.Pool's imap method
     before items get consumed by the iteration caller.
-    This prevents OOM issues in situations where items represent larger memory allocations."""
-    def __init__(self, processes=None, initializer=None, initargs=None, process_ahead=None, sleeping_for=0.1):
+    This prevents OOM issues in situations where items represent larger memory allocations.
+    Back-pressure is event-driven: Feeding of new items blocks on a condition that gets notified
+    as soon as the caller consumes a result. Queue depth and waiting times are tracked (see stats).
+    With use_threads=True a pool of threads is used instead of processes - suitable for work that is I/O bound
+    or releases the GIL, as it avoids forking, pickling and per-process memory.
+    The pool can be used for any number of consecutive imap iterations."""
+    def __init__(self, processes=None, initializer=None, initargs=None, process_ahead=None, use_threads=False):
         self.process_ahead = os.cpu_count() if process_ahead is None else process_ahead
-        self.sleeping_for = sleeping_for
-        self.processed = 0
-        self.pool = Pool(processes=processes, initializer=initializer, initargs=initargs)
+        self.feeds = set()
+        self.terminated = False
+        self.condition = Condition()
+        self.num_results = 0
+        self.total_depth = 0
+        self.feeding_wait_time = 0.0
+        self.consuming_wait_time = 0.0
+        pool_class = ThreadPool if use_threads else Pool
+        self.pool = pool_class(processes=processes, initializer=initializer, initargs=initargs)
 
     def __enter__(self):
         return self
 
-    def _limit(self, it):
+    def _limit(self, it, feed):
         for obj in it:
-            while self.processed >= self.process_ahead:
-                time.sleep(self.sleeping_for)
-            self.processed += 1
+            with self.condition:
+                if feed.processed >= self.process_ahead and not feed.stopped:
+                    wait_start = time.perf_counter()
+                    self.condition.wait_for(lambda: feed.processed < self.process_ahead or feed.stopped)
+                    self.feeding_wait_time += time.perf_counter() - wait_start
+                if feed.stopped:
+                    return
+                feed.processed += 1
             yield obj
 
     def imap(self, fun, it):
-        for obj in self.pool.imap(fun, self._limit(it)):
-            self.processed -= 1
-            yield obj
+        feed = _Feed()
+        with self.condition:
+            self.feeds.add(feed)
+        results = self.pool.imap(fun, self._limit(it, feed))
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                try:
+                    obj = next(results)
+                except StopIteration:
+                    return
+                with self.condition:
+                    self.consuming_wait_time += time.perf_counter() - wait_start
+                    self.num_results += 1
+                    self.total_depth += feed.processed
+                    feed.processed -= 1
+                    self.condition.notify_all()
+                yield obj
+        finally:
+            self._stop_feed(feed)
+            if not self.terminated:
+                # An abandoned iteration waits for its items in flight, so that following iterations
+                # get the workers (and resources they write to) to themselves
+                for _ in range(feed.processed):
+                    try:
+                        next(results)
+                    except StopIteration:
+                        break
+                    except Exception:  # pylint: disable=broad-except
+                        pass
+
+    def _stop_feed(self, feed):
+        with self.condition:
+            feed.stopped = True
+            self.feeds.discard(feed)
+            self.condition.notify_all()
+
+    def stop(self):
+        """Stops feeding items to the pool in all current iterations"""
+        with self.condition:
+            for feed in list(self.feeds):
+                self._stop_feed(feed)
+
+    @staticmethod
+    def empty_stats():
+        """Statistics of a pool that did not process anything yet - see stats"""
+        return {'results': 0, 'mean_depth': 0.0, 'feeding_wait_time': 0.0, 'consuming_wait_time': 0.0}
+
+    def stats(self):
+        """
+        Returns a dict with the number of results, the mean number of items in flight (queue depth) when a result
+        got consumed and the accumulated times (in seconds) that feeding waited for the caller to consume results
+        (pool saturated) and that the caller waited for results (pool starving).
+        """
+        with self.condition:
+            return {
+                'results': self.num_results,
+                'mean_depth': self.total_depth / self.num_results if self.num_results > 0 else 0.0,
+                'feeding_wait_time': self.feeding_wait_time,
+                'consuming_wait_time': self.consuming_wait_time
+            }
 
     def terminate(self):
+        self.terminated = True
+        self.stop()
         self.pool.terminate()
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
         self.pool.close()
 
 
@@ -4,8 +4,16 @@ into HDFS storage using Tensorflow's C++ FileStream API.
 Currently only includes wrappers for Google's GCS, but this can easily be expanded for AWS S3 buckets.
 """
 import os
+import hashlib
+import tempfile
+from multiprocessing import Value
 from tensorflow.io import gfile
 
+CACHE_EVICTION_RATIO = 0.9
+CACHE_OPEN_ATTEMPTS = 3
+
+_remote_cache = None
+
 
 def is_remote_path(path):
     """
@@ -79,3 +87,123 @@ def remove_remote(filename):
     """
     # Conditional import
     return gfile.remove(filename)
+
+
+class RemoteFileCache:
+    """
+    Local on-disk cache for remote files (like `gs://...`) with a size cap and least-recently-used eviction.
+    Cached files are addressed by a hash of their remote path - remote files are expected to not change.
+    Hit and miss counters as well as the cache size are shared with forked (worker) processes.
+    """
+    def __init__(self, cache_dir, max_size):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Local directory to keep the cached files in
+        max_size : int
+            Size cap of the cache in bytes - least recently used files are evicted when it gets exceeded
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = Value('L', 0)
+        self.misses = Value('L', 0)
+        self.size = Value('Q', sum(size for _, _, size in self._list_files()))
+
+    def _list_files(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def _evict(self, keep=None):
+        """Removes least recently used files until the cache is below its size cap - except for the file at keep"""
+        with self.size.get_lock():
+            if self.size.value <= self.max_size:
+                return
+            files = sorted(self._list_files(), key=lambda f: f[1])
+            size = sum(file_size for _, _, file_size in files)
+            for path, _, file_size in files:
+                if size <= CACHE_EVICTION_RATIO * self.max_size:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    size -= file_size
+                except FileNotFoundError:
+                    pass  # evicted by another process
+            self.size.value = size
+
+    def get_path(self, path):
+        """
+        Returns the path of the local copy of the remote file at path - downloads the file if not cached yet.
+        A freshly downloaded file is never evicted right away, even if it alone exceeds the size cap.
+        """
+        cached_path = os.path.join(self.cache_dir, hashlib.sha256(path.encode()).hexdigest())
+        try:
+            os.utime(cached_path)  # marks the file as recently used
+            with self.hits.get_lock():
+                self.hits.value += 1
+            return cached_path
+        except FileNotFoundError:
+            pass
+        with self.misses.get_lock():
+            self.misses.value += 1
+        # Writing to a temporary file and renaming it makes concurrent downloads of the same file safe
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.')
+        try:
+            with os.fdopen(tmp_fd, 'wb') as tmp_file, gfile.GFile(path, mode='rb') as remote_file:
+                tmp_file.write(remote_file.read())
+                file_size = tmp_file.tell()
+            os.replace(tmp_path, cached_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self.size.get_lock():
+            self.size.value += file_size
+        self._evict(keep=cached_path)
+        return cached_path
+
+    def open(self, path, buffering=-1):
+        """
+        Opens the local copy of the remote file at path for binary reading.
+        Falls back to reading the remote file directly, if other processes keep evicting the local copy.
+        """
+        for _ in range(CACHE_OPEN_ATTEMPTS):
+            try:
+                return open(self.get_path(path), 'rb', buffering=buffering)
+            except FileNotFoundError:
+                pass  # evicted by another process in the meantime
+        return gfile.GFile(path, mode='rb')
+
+    def stats(self):
+        return {'hits': self.hits.value, 'misses': self.misses.value, 'size': self.size.value}
+
+
+def enable_remote_cache(cache_dir, max_size):
+    """
+    Lets open_cached read remote files through a local util.io.RemoteFileCache.
+    Has to be called before forking processes that should share the cache statistics.
+    """
+    global _remote_cache  # pylint: disable=global-statement
+    _remote_cache = RemoteFileCache(cache_dir, max_size)
+    return _remote_cache
+
+
+def get_remote_cache():
+    """
+    Returns the util.io.RemoteFileCache enabled by enable_remote_cache or None
+    """
+    return _remote_cache
+
+
+def open_cached(path, buffering=-1):
+    """
+    Opens a local or remote file for binary reading.
+    Remote files are read through the local cache, if enabled by enable_remote_cache.
+    """
+    if _remote_cache is not None and is_remote_path(path):
+        return _remote_cache.open(path, buffering=buffering)
+    return open_remote(path, 'rb', buffering=buffering)
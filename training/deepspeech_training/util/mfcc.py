@@ -0,0 +1,191 @@
+"""
+NumPy implementation of the MFCC front-end, numerically matching TensorFlow's AudioSpectrogram and Mfcc ops
+(as used by feeding.audio_to_features). It allows computing features in workers and tools without TensorFlow
+(like precompute_features.py).
+"""
+from functools import lru_cache
+
+import numpy as np
+
+FILTERBANK_FLOOR = 1e-12
+
+
+def freq_to_mel(freq):
+    """HTK mel scale as used by TensorFlow's MfccMelFilterbank"""
+    return 1127.0 * np.log1p(np.asarray(freq, dtype=np.float64) / 700.0)
+
+
+@lru_cache(maxsize=8)
+def hann_window(window_size):
+    """Periodic Hann window"""
+    return 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(window_size) / window_size)
+
+
+@lru_cache(maxsize=8)
+def fft_length(window_size):
+    """Smallest power of two that is not smaller than the window size"""
+    return 1 << int(window_size - 1).bit_length()
+
+
+@lru_cache(maxsize=8)
+def mel_weights(input_length, sample_rate, filterbank_channel_count, lower_frequency_limit, upper_frequency_limit):
+    """
+    Dense version of TensorFlow's triangular mel filterbank.
+
+    Returns
+    -------
+    numpy.ndarray
+        Weight matrix of shape (input_length, filterbank_channel_count) to multiply magnitude spectra with
+    """
+    mel_low = freq_to_mel(lower_frequency_limit)
+    mel_spacing = (freq_to_mel(upper_frequency_limit) - mel_low) / (filterbank_channel_count + 1)
+    center_frequencies = mel_low + mel_spacing * np.arange(1, filterbank_channel_count + 2)
+    hz_per_sbin = 0.5 * sample_rate / (input_length - 1)
+    start_index = int(1.5 + lower_frequency_limit / hz_per_sbin)
+    end_index = min(int(upper_frequency_limit / hz_per_sbin), input_length - 1)
+    weights = np.zeros((input_length, filterbank_channel_count + 1), dtype=np.float64)
+    if end_index < start_index:
+        return weights[:, :filterbank_channel_count]
+    indices = np.arange(start_index, end_index + 1)
+    mels = freq_to_mel(indices * hz_per_sbin)
+    # Index of the first center frequency that is not below the bin's mel frequency (capped at the channel count)
+    upper_channels = np.minimum(np.searchsorted(center_frequencies[:filterbank_channel_count], mels, side='left'),
+                                filterbank_channel_count)
+    lower_centers = np.where(upper_channels > 0, center_frequencies[upper_channels - 1], mel_low)
+    upper_centers = center_frequencies[upper_channels]
+    lower_weights = (upper_centers - mels) / (upper_centers - lower_centers)
+    # Column 0 of the extended matrix stands for "no lower channel" and gets dropped
+    np.add.at(weights, (indices, upper_channels), lower_weights)
+    upper_mask = upper_channels < filterbank_channel_count
+    np.add.at(weights, (indices[upper_mask], upper_channels[upper_mask] + 1), 1.0 - lower_weights[upper_mask])
+    return weights[:, 1:] if filterbank_channel_count > 0 else weights[:, :0]
+
+
+@lru_cache(maxsize=8)
+def dct_matrix(input_length, coefficient_count):
+    """DCT-II matrix of shape (input_length, coefficient_count) as used by TensorFlow's MfccDct"""
+    if coefficient_count > input_length:
+        raise ValueError('DCT coefficient count ({}) must not exceed the filterbank channel count ({})'
+                         .format(coefficient_count, input_length))
+    i = np.arange(coefficient_count)[np.newaxis, :]
+    j = np.arange(input_length)[:, np.newaxis]
+    return np.sqrt(2.0 / input_length) * np.cos(np.pi / input_length * i * (j + 0.5))
+
+
+def spectrogram(audio, window_size, stride, magnitude_squared=True):
+    """
+    Computes a spectrogram like TensorFlow's AudioSpectrogram op.
+
+    Parameters
+    ----------
+    audio : numpy.ndarray
+        Mono audio signal of shape (samples,) or (samples, 1) - or a batch of equally long signals of shape
+        (batch, samples) with more than one sample per signal
+    window_size : int
+        Number of samples per window
+    stride : int
+        Number of samples between window starts
+    magnitude_squared : bool
+        If to return squared magnitudes instead of magnitudes
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 array of shape (frames, fft_length // 2 + 1) - or (batch, frames, fft_length // 2 + 1) for batches
+    """
+    audio = np.asarray(audio, dtype=np.float64)
+    if audio.ndim == 2 and audio.shape[1] == 1:
+        audio = audio[:, 0]
+    elif audio.ndim not in [1, 2]:
+        raise ValueError('Audio has to be a mono signal or a batch of mono signals')
+    audio = np.ascontiguousarray(audio)
+    window_size, stride = int(window_size), int(stride)
+    num_bins = fft_length(window_size) // 2 + 1
+    num_frames = max(0, 1 + (audio.shape[-1] - window_size) // stride)
+    if num_frames == 0:
+        return np.zeros(audio.shape[:-1] + (0, num_bins), dtype=np.float32)
+    # Windows are views into the signals - the last axis becomes (frames, window samples)
+    frames = np.lib.stride_tricks.as_strided(audio,
+                                             shape=audio.shape[:-1] + (num_frames, window_size),
+                                             strides=audio.strides[:-1] + (audio.strides[-1] * stride,
+                                                                           audio.strides[-1]),
+                                             writeable=False)
+    spectra = np.fft.rfft(frames * hann_window(window_size), n=fft_length(window_size), axis=-1)
+    power = spectra.real ** 2 + spectra.imag ** 2
+    return (power if magnitude_squared else np.sqrt(power)).astype(np.float32)
+
+
+def mfcc(spectrogram_squared,
+         sample_rate,
+         dct_coefficient_count=13,
+         upper_frequency_limit=4000,
+         lower_frequency_limit=20,
+         filterbank_channel_count=40):
+    """
+    Computes MFCCs from a squared magnitude spectrogram like TensorFlow's Mfcc op.
+
+    Parameters
+    ----------
+    spectrogram_squared : numpy.ndarray
+        Squared magnitude spectrogram of shape (..., bins)
+    sample_rate : int
+        Sample rate of the original audio signal
+    dct_coefficient_count : int
+        Number of MFCCs per frame
+    upper_frequency_limit : float
+    lower_frequency_limit : float
+    filterbank_channel_count : int
+        Number of mel filterbank channels
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 array of shape (..., dct_coefficient_count)
+    """
+    spectrogram_squared = np.asarray(spectrogram_squared, dtype=np.float64)
+    weights = mel_weights(spectrogram_squared.shape[-1],
+                          float(sample_rate),
+                          int(filterbank_channel_count),
+                          float(lower_frequency_limit),
+                          float(upper_frequency_limit))
+    mel = np.sqrt(spectrogram_squared) @ weights
+    log_mel = np.log(np.maximum(mel, FILTERBANK_FLOOR))
+    return (log_mel @ dct_matrix(int(filterbank_channel_count), int(dct_coefficient_count))).astype(np.float32)
+
+
+def audio_to_features(audio,
+                      sample_rate,
+                      window_size,
+                      stride,
+                      dct_coefficient_count=26,
+                      upper_frequency_limit=None):
+    """
+    NumPy counterpart of feeding.audio_to_features (without augmentations).
+
+    Parameters
+    ----------
+    audio : numpy.ndarray
+        Mono audio signal of shape (samples,) or (samples, 1) with values between -1.0 and 1.0 -
+        or a batch of equally long signals of shape (batch, samples)
+    sample_rate : int
+    window_size : int
+        Number of samples per feature window (Config.audio_window_samples)
+    stride : int
+        Number of samples between feature windows (Config.audio_step_samples)
+    dct_coefficient_count : int
+        Number of MFCCs per frame (Config.n_input)
+    upper_frequency_limit : float or None
+        Upper limit of the mel filterbank - defaults to half the sample rate
+        (feeding.audio_to_features uses half of FLAGS.audio_sample_rate)
+
+    Returns
+    -------
+    tuple of numpy.ndarray, int
+        Features of shape (frames, dct_coefficient_count) - or (batch, frames, dct_coefficient_count) for batches -
+        and the number of frames
+    """
+    features = mfcc(spectrogram(audio, window_size, stride),
+                    sample_rate,
+                    dct_coefficient_count=dct_coefficient_count,
+                    upper_frequency_limit=sample_rate / 2 if upper_frequency_limit is None else upper_frequency_limit)
+    return features, features.shape[-2]
@@ -3,12 +3,18 @@ import os
 import io
 import csv
 import json
+import mmap
+import zlib
 import tarfile
+import numpy as np
+import pandas as pd
 
 from pathlib import Path
 from functools import partial
+from multiprocessing import Queue, Process
+from queue import Full
 
-from .helpers import KILOBYTE, MEGABYTE, GIGABYTE, Interleaved, LenMap
+from .helpers import KILOBYTE, MEGABYTE, GIGABYTE, Interleaved, LenMap, prefetch
 from .audio import (
     Sample,
     AUDIO_TYPE_PCM,
@@ -17,11 +23,13 @@ from .audio import (
     get_loadable_audio_type_from_extension,
     write_wav
 )
-from .io import open_remote, is_remote_path
+from .io import open_remote, open_cached, is_remote_path, remove_remote
 
 BIG_ENDIAN = 'big'
 INT_SIZE = 4
 BIGINT_SIZE = 2 * INT_SIZE
+BIGINT_DTYPE = np.dtype('>u8')
+DURATION_DTYPE = np.dtype('>f8')
 MAGIC = b'SAMPLEDB'
 
 BUFFER_SIZE = 1 * MEGABYTE
@@ -29,16 +37,34 @@ REVERSE_BUFFER_SIZE = 16 * KILOBYTE
 CACHE_SIZE = 1 * GIGABYTE
 
 SCHEMA_KEY = 'schema'
+INDEX_KEY = 'index'
+BLOCKS_KEY = 'blocks'
 CONTENT_KEY = 'content'
 MIME_TYPE_KEY = 'mime-type'
+DTYPE_KEY = 'dtype'
+COMPRESSION_KEY = 'compression'
+BLOCK_SIZE_KEY = 'block-size'
+COMPRESSION_ZLIB = 'zlib'
 MIME_TYPE_TEXT = 'text/plain'
 CONTENT_TYPE_SPEECH = 'speech'
 CONTENT_TYPE_TRANSCRIPT = 'transcript'
+CONTENT_TYPE_DURATION = 'duration'
+TRANSCRIPT_BLOCK_SIZE = 1024
+
+SHARDED_SDB_EXTENSION = '.sdbs'
+SHARDS_KEY = 'shards'
+SHARD_FILENAME_KEY = 'filename'
+SHARD_SAMPLES_KEY = 'num_samples'
+SHARD_MIN_DURATION_KEY = 'min_duration'
+SHARD_MAX_DURATION_KEY = 'max_duration'
+SHARD_QUEUE_SIZE = 16
 
 
 class LabeledSample(Sample):
     """In-memory labeled audio sample representing an utterance.
     Derived from util.audio.Sample and used by sample collection readers and writers."""
+    __slots__ = ('transcript',)
+
     def __init__(self, audio_type, raw_data, transcript, audio_format=None, sample_id=None):
         """
         Parameters
@@ -58,6 +84,13 @@ class LabeledSample(Sample):
         super().__init__(audio_type, raw_data, audio_format=audio_format, sample_id=sample_id)
         self.transcript = transcript
 
+    def __getstate__(self):
+        return super().__getstate__() + (self.transcript,)
+
+    def __setstate__(self, state):
+        super().__setstate__(state[:-1])
+        self.transcript = state[-1]
+
 
 class PackedSample:
     """
@@ -65,13 +98,21 @@ class PackedSample:
     have the child process do the loading/unpacking of the sample, allowing for parallel file
     I/O.
     """
+    __slots__ = ('filename', 'audio_type', 'label')
+
     def __init__(self, filename, audio_type, label):
         self.filename = filename
         self.audio_type = audio_type
         self.label = label
 
+    def __getstate__(self):
+        return self.filename, self.audio_type, self.label
+
+    def __setstate__(self, state):
+        self.filename, self.audio_type, self.label = state
+
     def unpack(self):
-        with open_remote(self.filename, 'rb') as audio_file:
+        with open_cached(self.filename) as audio_file:
             data = audio_file.read()
         if self.label is None:
             s = Sample(self.audio_type, data, sample_id=self.filename)
@@ -123,7 +164,9 @@ class DirectSDBWriter:
                  audio_type=AUDIO_TYPE_OPUS,
                  bitrate=None,
                  id_prefix=None,
-                 labeled=True):
+                 labeled=True,
+                 durations=True,
+                 columnar=False):
         """
         Parameters
         ----------
@@ -140,6 +183,14 @@ class DirectSDBWriter:
         labeled : bool or None
             If True: Writes labeled samples (util.sample_collections.LabeledSample) only.
             If False: Ignores transcripts (if available) and writes (unlabeled) util.audio.Sample instances.
+        durations : bool
+            If True: Writes sample durations (in seconds) as a fixed-width index column next to the offset index.
+            This allows readers to sort, merge and bucket samples without reading any audio data.
+        columnar : bool
+            If True: Transcripts are not stored next to the audio data of each sample, but in a separate region
+            (behind the index) as zlib-compressed blocks of TRANSCRIPT_BLOCK_SIZE transcripts each.
+            Transcript-only scans (see SDB.transcripts) will then not have to read any audio data.
+            Blocks get compressed as soon as they are full, so only the compressed blocks are kept in memory.
         """
         self.sdb_filename = sdb_filename
         self.id_prefix = sdb_filename if id_prefix is None else id_prefix
@@ -150,14 +201,26 @@ class DirectSDBWriter:
         self.bitrate = bitrate
         self.sdb_file = open_remote(sdb_filename, 'wb', buffering=buffering)
         self.offsets = []
+        self.durations = [] if durations else None
+        self.columnar = bool(labeled and columnar)
+        self.block_size = TRANSCRIPT_BLOCK_SIZE
+        self.transcript_block = []
+        self.transcript_blocks = []
         self.num_samples = 0
 
         self.sdb_file.write(MAGIC)
 
         schema_entries = [{CONTENT_KEY: CONTENT_TYPE_SPEECH, MIME_TYPE_KEY: audio_type}]
-        if self.labeled:
+        if self.labeled and not self.columnar:
             schema_entries.append({CONTENT_KEY: CONTENT_TYPE_TRANSCRIPT, MIME_TYPE_KEY: MIME_TYPE_TEXT})
         meta_data = {SCHEMA_KEY: schema_entries}
+        if self.durations is not None:
+            meta_data[INDEX_KEY] = [{CONTENT_KEY: CONTENT_TYPE_DURATION, DTYPE_KEY: DURATION_DTYPE.str}]
+        if self.columnar:
+            meta_data[BLOCKS_KEY] = [{CONTENT_KEY: CONTENT_TYPE_TRANSCRIPT,
+                                      MIME_TYPE_KEY: MIME_TYPE_TEXT,
+                                      COMPRESSION_KEY: COMPRESSION_ZLIB,
+                                      BLOCK_SIZE_KEY: self.block_size}]
         meta_data = json.dumps(meta_data).encode()
         self.write_big_int(len(meta_data))
         self.sdb_file.write(meta_data)
@@ -180,19 +243,31 @@ class DirectSDBWriter:
         sample.change_audio_type(self.audio_type, bitrate=self.bitrate)
         opus = sample.audio.getbuffer()
         opus_len = to_bytes(len(opus))
-        if self.labeled:
-            transcript = sample.transcript.encode()
+        transcript = sample.transcript.encode() if self.labeled else None
+        if self.labeled and not self.columnar:
             transcript_len = to_bytes(len(transcript))
             entry_len = to_bytes(len(opus_len) + len(opus) + len(transcript_len) + len(transcript))
             buffer = b''.join([entry_len, opus_len, opus, transcript_len, transcript])
         else:
             entry_len = to_bytes(len(opus_len) + len(opus))
             buffer = b''.join([entry_len, opus_len, opus])
+        sample.sample_id = self.add_entry(buffer, duration=sample.duration, transcript=transcript)
+        return sample.sample_id
+
+    def add_entry(self, entry, duration=None, transcript=None):
+        """Appends an already serialized sample entry (including its length prefix) as returned by SDB.read_entry.
+        The entry has to follow the schema of this writer. The (encoded) transcript is only used by columnar writers."""
         self.offsets.append(self.sdb_file.tell())
-        self.sdb_file.write(buffer)
-        sample.sample_id = '{}:{}'.format(self.id_prefix, self.num_samples)
+        self.sdb_file.write(entry)
+        if self.durations is not None:
+            self.durations.append(duration)
+        if self.columnar:
+            self.transcript_block.append(transcript)
+            if len(self.transcript_block) == self.block_size:
+                self.flush_transcript_block()
+        sample_id = '{}:{}'.format(self.id_prefix, self.num_samples)
         self.num_samples += 1
-        return sample.sample_id
+        return sample_id
 
     def close(self):
         if self.sdb_file is None:
@@ -204,14 +279,37 @@ class DirectSDBWriter:
 
         self.sdb_file.seek(offset_index + BIGINT_SIZE)
         self.write_big_int(self.num_samples)
-        for offset in self.offsets:
-            self.write_big_int(offset)
+        self.sdb_file.write(np.array(self.offsets, dtype=BIGINT_DTYPE).tobytes())
         offset_end = self.sdb_file.tell()
         self.sdb_file.seek(offset_index)
         self.write_big_int(offset_end - offset_index - BIGINT_SIZE)
+        if self.durations is not None:
+            self.sdb_file.seek(offset_end)
+            self.write_big_int(BIGINT_SIZE + self.num_samples * DURATION_DTYPE.itemsize)
+            self.write_big_int(self.num_samples)
+            self.sdb_file.write(np.array(self.durations, dtype=DURATION_DTYPE).tobytes())
+            offset_end = self.sdb_file.tell()
+        if self.columnar:
+            self.flush_transcript_block()
+            self.sdb_file.seek(offset_end)
+            self.write_blocks(self.transcript_blocks)
         self.sdb_file.close()
         self.sdb_file = None
 
+    def flush_transcript_block(self):
+        if self.transcript_block:
+            block = b''.join(len(value).to_bytes(INT_SIZE, BIG_ENDIAN) + value for value in self.transcript_block)
+            self.transcript_blocks.append(zlib.compress(block))
+            self.transcript_block = []
+
+    def write_blocks(self, blocks):
+        block_offsets = np.cumsum([0] + [len(block) for block in blocks]).astype(BIGINT_DTYPE)
+        self.write_big_int(BIGINT_SIZE + block_offsets.nbytes + int(block_offsets[-1]))
+        self.write_big_int(len(blocks))
+        self.sdb_file.write(block_offsets.tobytes())
+        for block in blocks:
+            self.sdb_file.write(block)
+
     def __len__(self):
         return len(self.offsets)
 
@@ -226,7 +324,8 @@ class SDB:  # pylint: disable=too-many-instance-attributes
                  buffering=BUFFER_SIZE,
                  id_prefix=None,
                  labeled=True,
-                 reverse=False):
+                 reverse=False,
+                 memory_map=False):
         """
         Parameters
         ----------
@@ -241,11 +340,19 @@ class SDB:  # pylint: disable=too-many-instance-attributes
             If False: Ignores transcripts (if available) and reads (unlabeled) util.audio.Sample instances.
             If None: Automatically determines if SDB schema has transcripts
             (reading util.sample_collections.LabeledSample instances) or not (reading util.audio.Sample instances).
+        reverse : bool
+            If the order of the samples should be reversed
+        memory_map : bool
+            If True: Memory-maps the SDB file and returns column data from read_row as memoryview slices of the mapping
+            (no copying). All processes mapping the same file share its pages through the OS page cache.
+            Ignored for remote files (gs://, hdfs://...), which are always read using buffered reads.
         """
         self.sdb_filename = sdb_filename
         self.id_prefix = sdb_filename if id_prefix is None else id_prefix
         self.sdb_file = open_remote(sdb_filename, 'rb', buffering=REVERSE_BUFFER_SIZE if reverse else buffering)
-        self.offsets = []
+        self.mmap = None
+        if memory_map and not is_remote_path(sdb_filename):
+            self.mmap = mmap.mmap(self.sdb_file.fileno(), 0, access=mmap.ACCESS_READ)
         if self.sdb_file.read(len(MAGIC)) != MAGIC:
             raise RuntimeError('No Sample Database')
         meta_chunk_len = self.read_big_int()
@@ -260,11 +367,15 @@ class SDB:  # pylint: disable=too-many-instance-attributes
         self.speech_index = speech_columns[0]
         self.audio_type = self.schema[self.speech_index][MIME_TYPE_KEY]
 
+        block_contents = [column[CONTENT_KEY] for column in self.meta.get(BLOCKS_KEY, [])]
         self.transcript_index = None
+        self.block_transcripts = False
         if labeled is not False:
             transcript_columns = self.find_columns(content=CONTENT_TYPE_TRANSCRIPT, mime_type=MIME_TYPE_TEXT)
             if transcript_columns:
                 self.transcript_index = transcript_columns[0]
+            elif CONTENT_TYPE_TRANSCRIPT in block_contents:
+                self.block_transcripts = True
             else:
                 if labeled is True:
                     raise RuntimeError('No transcript data (missing in schema)')
@@ -272,10 +383,36 @@ class SDB:  # pylint: disable=too-many-instance-attributes
         sample_chunk_len = self.read_big_int()
         self.sdb_file.seek(sample_chunk_len + BIGINT_SIZE, 1)
         num_samples = self.read_big_int()
-        for _ in range(num_samples):
-            self.offsets.append(self.read_big_int())
+        # The offset index is loaded as a whole (or just mapped) into a NumPy array of 8 bytes per sample
+        self.offsets = self.read_index_column(num_samples, BIGINT_DTYPE)
+
+        # Optional fixed-width index columns (like sample durations) are following the offset index
+        self.index_columns = {}
+        for column in self.meta.get(INDEX_KEY, []):
+            self.sdb_file.seek(BIGINT_SIZE, 1)
+            column_samples = self.read_big_int()
+            if column_samples != num_samples:
+                raise RuntimeError('Index column "{}" has wrong number of entries'.format(column[CONTENT_KEY]))
+            self.index_columns[column[CONTENT_KEY]] = self.read_index_column(num_samples, np.dtype(column[DTYPE_KEY]))
+        self.durations = self.index_columns.get(CONTENT_TYPE_DURATION, None)
+
+        # Optional compressed block columns (like transcripts of columnar SDBs) are following the index columns
+        self.block_columns = {}
+        for column in self.meta.get(BLOCKS_KEY, []):
+            if column.get(COMPRESSION_KEY) != COMPRESSION_ZLIB:
+                raise RuntimeError('Unsupported compression of block column "{}"'.format(column[CONTENT_KEY]))
+            self.sdb_file.seek(BIGINT_SIZE, 1)
+            num_blocks = self.read_big_int()
+            block_offsets = self.read_index_column(num_blocks + 1, BIGINT_DTYPE)
+            self.block_columns[column[CONTENT_KEY]] = (column[BLOCK_SIZE_KEY], self.sdb_file.tell(), block_offsets)
+            self.sdb_file.seek(int(block_offsets[-1]), 1)
+        self.cached_block = (None, None, None)
+
+        self.reverse = reverse
         if reverse:
-            self.offsets.reverse()
+            self.offsets = self.offsets[::-1]
+            self.index_columns = {content: values[::-1] for content, values in self.index_columns.items()}
+            self.durations = None if self.durations is None else self.durations[::-1]
 
     def read_int(self):
         return int.from_bytes(self.sdb_file.read(INT_SIZE), BIG_ENDIAN)
@@ -283,6 +420,13 @@ class SDB:  # pylint: disable=too-many-instance-attributes
     def read_big_int(self):
         return int.from_bytes(self.sdb_file.read(BIGINT_SIZE), BIG_ENDIAN)
 
+    def read_index_column(self, num_samples, dtype):
+        if self.mmap is not None:
+            position = self.sdb_file.tell()
+            self.sdb_file.seek(num_samples * dtype.itemsize, 1)
+            return np.frombuffer(self.mmap, dtype=dtype, count=num_samples, offset=position)
+        return np.frombuffer(self.sdb_file.read(num_samples * dtype.itemsize), dtype=dtype)
+
     def find_columns(self, content=None, mime_type=None):
         criteria = []
         if content is not None:
@@ -308,7 +452,9 @@ class SDB:  # pylint: disable=too-many-instance-attributes
         if not 0 <= row_index < len(self.offsets):
             raise ValueError('Wrong sample index: {} - has to be between 0 and {}'
                              .format(row_index, len(self.offsets) - 1))
-        self.sdb_file.seek(self.offsets[row_index] + INT_SIZE)
+        if self.mmap is not None:
+            return self.read_mapped_row(row_index, columns)
+        self.sdb_file.seek(int(self.offsets[row_index]) + INT_SIZE)
         for index in range(len(self.schema)):
             chunk_len = self.read_int()
             if index in columns:
@@ -320,13 +466,80 @@ class SDB:  # pylint: disable=too-many-instance-attributes
                 self.sdb_file.seek(chunk_len, 1)
         return tuple(column_data)
 
+    def read_mapped_row(self, row_index, columns):
+        column_data = [None] * len(columns)
+        found = 0
+        position = int(self.offsets[row_index]) + INT_SIZE
+        for index in range(len(self.schema)):
+            chunk_len = int.from_bytes(self.mmap[position:position + INT_SIZE], BIG_ENDIAN)
+            position += INT_SIZE
+            if index in columns:
+                column_data[columns.index(index)] = memoryview(self.mmap)[position:position + chunk_len]
+                found += 1
+                if found == len(columns):
+                    break
+            position += chunk_len
+        return tuple(column_data)
+
+    def read_block(self, content, block_index):
+        if self.cached_block[:2] == (content, block_index):
+            return self.cached_block[2]
+        _, position, block_offsets = self.block_columns[content]
+        start, end = position + int(block_offsets[block_index]), position + int(block_offsets[block_index + 1])
+        if self.mmap is not None:
+            data = zlib.decompress(self.mmap[start:end])
+        else:
+            self.sdb_file.seek(start)
+            data = zlib.decompress(self.sdb_file.read(end - start))
+        values = []
+        position = 0
+        while position < len(data):
+            value_len = int.from_bytes(data[position:position + INT_SIZE], BIG_ENDIAN)
+            position += INT_SIZE
+            values.append(data[position:position + value_len])
+            position += value_len
+        self.cached_block = (content, block_index, values)
+        return values
+
+    def read_block_value(self, content, row_index):
+        if self.reverse:
+            row_index = len(self.offsets) - 1 - row_index
+        block_size = self.block_columns[content][0]
+        return self.read_block(content, row_index // block_size)[row_index % block_size]
+
+    def transcripts(self):
+        """Iterates over the transcripts of all samples (in reading order).
+        In case of columnar SDBs this only reads the compressed transcript blocks and no audio data."""
+        for i in range(len(self.offsets)):
+            if CONTENT_TYPE_TRANSCRIPT in self.block_columns:
+                transcript = self.read_block_value(CONTENT_TYPE_TRANSCRIPT, i)
+            elif self.transcript_index is not None:
+                [transcript] = self.read_row(i, self.transcript_index)
+            else:
+                raise RuntimeError('No transcript data')
+            yield str(transcript, 'utf-8')
+
+    def read_entry(self, row_index):
+        """Reads the raw serialized entry of a row (including its length prefix) without decoding its columns"""
+        offset = int(self.offsets[row_index])
+        if self.mmap is not None:
+            entry_len = int.from_bytes(self.mmap[offset:offset + INT_SIZE], BIG_ENDIAN)
+            return memoryview(self.mmap)[offset:offset + INT_SIZE + entry_len]
+        self.sdb_file.seek(offset)
+        entry_len = self.sdb_file.read(INT_SIZE)
+        return entry_len + self.sdb_file.read(int.from_bytes(entry_len, BIG_ENDIAN))
+
     def __getitem__(self, i):
         sample_id = '{}:{}'.format(self.id_prefix, i)
-        if self.transcript_index is None:
+        if self.block_transcripts:
+            [audio_data] = self.read_row(i, self.speech_index)
+            transcript = self.read_block_value(CONTENT_TYPE_TRANSCRIPT, i)
+        elif self.transcript_index is None:
             [audio_data] = self.read_row(i, self.speech_index)
             return Sample(self.audio_type, audio_data, sample_id=sample_id)
-        audio_data, transcript = self.read_row(i, self.speech_index, self.transcript_index)
-        transcript = transcript.decode()
+        else:
+            audio_data, transcript = self.read_row(i, self.speech_index, self.transcript_index)
+        transcript = str(transcript, 'utf-8')
         return LabeledSample(self.audio_type, audio_data, transcript, sample_id=sample_id)
 
     def __iter__(self):
@@ -337,6 +550,12 @@ class SDB:  # pylint: disable=too-many-instance-attributes
         return len(self.offsets)
 
     def close(self):
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass  # memoryview slices are still in use - the mapping gets released together with them
+            self.mmap = None
         if self.sdb_file is not None:
             self.sdb_file.close()
 
@@ -344,6 +563,321 @@ class SDB:  # pylint: disable=too-many-instance-attributes
         self.close()
 
 
+def get_shard_filename(manifest_filename, shard_index):
+    return '{}.{:05d}.sdb'.format(os.path.splitext(manifest_filename)[0], shard_index)
+
+
+def _write_shards(queue, shards, writer_kwargs):
+    """
+    Worker process function of ShardedSDBWriter.
+    Unpacks, encodes and writes all samples it receives through queue to the shard files it owns.
+    """
+    writers = {shard_index: DirectSDBWriter(shard_filename, **writer_kwargs) for shard_index, shard_filename in shards}
+    try:
+        for shard_index, sample in iter(queue.get, None):
+            writers[shard_index].add(unpack_maybe(sample))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+class ShardedSDBWriter:  # pylint: disable=too-many-instance-attributes
+    """Sample collection writer for writing a sharded SDB set - a number of SDB shard files and a manifest file.
+    Samples get distributed over the shards in a round-robin fashion. Shards are encoded and written in parallel
+    by worker processes."""
+    def __init__(self,
+                 manifest_filename,
+                 num_shards=1,
+                 buffering=BUFFER_SIZE,
+                 audio_type=AUDIO_TYPE_OPUS,
+                 bitrate=None,
+                 id_prefix=None,
+                 labeled=True,
+                 workers=None,
+                 columnar=False):
+        """
+        Parameters
+        ----------
+        manifest_filename : str
+            Path to the manifest file (.sdbs) to write. Shard files are written next to it.
+        num_shards : int
+            Number of SDB shard files to distribute the samples to
+        buffering : int
+            Write-buffer size to use while writing the SDB shard files
+        audio_type : str
+            See util.audio.Sample.__init__ .
+        bitrate : int
+            Bitrate for sample-compression in case of lossy audio_type (e.g. AUDIO_TYPE_OPUS)
+        id_prefix : str
+            Prefix for IDs of written samples - defaults to manifest_filename
+        labeled : bool or None
+            If True: Writes labeled samples (util.sample_collections.LabeledSample) only.
+            If False: Ignores transcripts (if available) and writes (unlabeled) util.audio.Sample instances.
+        workers : int
+            Number of worker processes for encoding and writing shards - defaults to number of CPUs (at most num_shards)
+        columnar : bool
+            If to write the shards with columnar transcripts - see DirectSDBWriter
+        """
+        if num_shards < 1:
+            raise ValueError('At least one shard required')
+        self.manifest_filename = manifest_filename
+        self.id_prefix = manifest_filename if id_prefix is None else id_prefix
+        self.labeled = labeled
+        self.shard_filenames = [get_shard_filename(manifest_filename, i) for i in range(num_shards)]
+        writer_kwargs = dict(buffering=buffering,
+                             audio_type=audio_type,
+                             bitrate=bitrate,
+                             labeled=labeled,
+                             columnar=columnar)
+        workers = min(num_shards, os.cpu_count() if workers is None else max(1, workers))
+        self.queues = [Queue(SHARD_QUEUE_SIZE) for _ in range(workers)]
+        self.processes = []
+        for worker_index, queue in enumerate(self.queues):
+            shards = [(i, self.shard_filenames[i]) for i in range(worker_index, num_shards, workers)]
+            process = Process(target=_write_shards, args=(queue, shards, writer_kwargs))
+            process.start()
+            self.processes.append(process)
+        self.num_samples = 0
+
+    def __enter__(self):
+        return self
+
+    def put(self, worker_index, item):
+        """Puts an item into the queue of a worker - fails instead of blocking forever if the worker exited"""
+        while True:
+            try:
+                self.queues[worker_index].put(item, timeout=1.0)
+                return
+            except Full:
+                if not self.processes[worker_index].is_alive():
+                    raise RuntimeError('Shard writer process exited unexpectedly')
+
+    def add(self, sample):
+        shard_index = self.num_samples % len(self.shard_filenames)
+        worker_index = shard_index % len(self.queues)
+        self.put(worker_index, (shard_index, sample))
+        sample.sample_id = '{}:{}'.format(self.id_prefix, self.num_samples)
+        self.num_samples += 1
+        return sample.sample_id
+
+    def close(self):
+        if not self.processes:
+            return
+        for worker_index in range(len(self.queues)):
+            try:
+                self.put(worker_index, None)
+            except RuntimeError:
+                pass  # reported below by the worker's exit code
+        for process in self.processes:
+            process.join()
+        failed = any(process.exitcode != 0 for process in self.processes)
+        self.processes = []
+        if failed:
+            raise RuntimeError('Failed writing SDB shards')
+        shards = []
+        for shard_filename in self.shard_filenames:
+            shard = SDB(shard_filename, labeled=False)
+            shards.append({
+                SHARD_FILENAME_KEY: os.path.basename(shard_filename),
+                SHARD_SAMPLES_KEY: len(shard),
+                SHARD_MIN_DURATION_KEY: float(shard.durations.min()) if len(shard) > 0 else 0.0,
+                SHARD_MAX_DURATION_KEY: float(shard.durations.max()) if len(shard) > 0 else 0.0
+            })
+            shard.close()
+        with open_remote(self.manifest_filename, 'w', encoding='utf-8') as manifest_file:
+            json.dump({SHARDS_KEY: shards}, manifest_file, indent=2)
+
+    def __len__(self):
+        return self.num_samples
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ParallelSDBWriter:
+    """Sample collection writer for writing one SDB file using parallel worker processes.
+    Workers encode and write the samples (round-robin) into temporary segment SDB files.
+    On closing, the segments get stitched into the target SDB file by copying their raw entries,
+    restoring the original sample order and rebuilding the offset index. Requires temporary space for the segments."""
+    def __init__(self,
+                 sdb_filename,
+                 buffering=BUFFER_SIZE,
+                 audio_type=AUDIO_TYPE_OPUS,
+                 bitrate=None,
+                 id_prefix=None,
+                 labeled=True,
+                 workers=None,
+                 columnar=False):
+        """
+        Parameters
+        ----------
+        sdb_filename : str
+            Path to the SDB file to write
+        buffering : int
+            Write-buffer size to use while writing the segment files and the SDB file
+        audio_type : str
+            See util.audio.Sample.__init__ .
+        bitrate : int
+            Bitrate for sample-compression in case of lossy audio_type (e.g. AUDIO_TYPE_OPUS)
+        id_prefix : str
+            Prefix for IDs of written samples - defaults to sdb_filename
+        labeled : bool or None
+            If True: Writes labeled samples (util.sample_collections.LabeledSample) only.
+            If False: Ignores transcripts (if available) and writes (unlabeled) util.audio.Sample instances.
+        workers : int
+            Number of worker processes (and temporary segments) - defaults to number of CPUs
+        columnar : bool
+            If to write the SDB file (and its segments) with columnar transcripts - see DirectSDBWriter
+        """
+        self.sdb_filename = sdb_filename
+        self.buffering = buffering
+        self.audio_type = audio_type
+        self.id_prefix = sdb_filename if id_prefix is None else id_prefix
+        self.labeled = labeled
+        self.columnar = columnar
+        workers = os.cpu_count() if workers is None else max(1, workers)
+        self.segments_writer = ShardedSDBWriter(sdb_filename + '.segments' + SHARDED_SDB_EXTENSION,
+                                                num_shards=workers,
+                                                buffering=buffering,
+                                                audio_type=audio_type,
+                                                bitrate=bitrate,
+                                                id_prefix=self.id_prefix,
+                                                labeled=labeled,
+                                                workers=workers,
+                                                columnar=columnar)
+
+    def __enter__(self):
+        return self
+
+    def add(self, sample):
+        return self.segments_writer.add(sample)
+
+    def close(self):
+        if self.segments_writer is None:
+            return
+        segments_writer, self.segments_writer = self.segments_writer, None
+        segments_writer.close()
+        segments = [SDB(segment_filename, labeled=None, memory_map=True)
+                    for segment_filename in segments_writer.shard_filenames]
+        with DirectSDBWriter(self.sdb_filename,
+                             buffering=self.buffering,
+                             audio_type=self.audio_type,
+                             id_prefix=self.id_prefix,
+                             labeled=self.labeled,
+                             columnar=self.columnar) as writer:
+            for i in range(len(segments_writer)):
+                segment = segments[i % len(segments)]
+                row_index = i // len(segments)
+                # Columnar segment entries only hold the audio - their transcripts have to be carried over separately
+                transcript = bytes(segment.read_block_value(CONTENT_TYPE_TRANSCRIPT, row_index)) \
+                    if writer.columnar else None
+                writer.add_entry(segment.read_entry(row_index),
+                                 duration=float(segment.durations[row_index]),
+                                 transcript=transcript)
+        for segment in segments:
+            segment.close()
+        for filename in segments_writer.shard_filenames + [segments_writer.manifest_filename]:
+            remove_remote(filename)
+
+    def __len__(self):
+        return len(self.segments_writer)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ShardedSDB:  # pylint: disable=too-many-instance-attributes
+    """Sample collection reader for reading a sharded SDB set (written by ShardedSDBWriter) as one collection"""
+    def __init__(self,
+                 manifest_filename,
+                 buffering=BUFFER_SIZE,
+                 id_prefix=None,
+                 labeled=True,
+                 reverse=False,
+                 memory_map=False,
+                 partition=None):
+        """
+        Parameters
+        ----------
+        manifest_filename : str
+            Path to the manifest file (.sdbs) of the sharded SDB set
+        buffering : int
+            See SDB.__init__ .
+        id_prefix : str
+            Prefix for IDs of read samples - defaults to manifest_filename
+        labeled : bool or None
+            See SDB.__init__ .
+        reverse : bool
+            If the order of the samples should be reversed
+        memory_map : bool
+            See SDB.__init__ .
+        partition : tuple of (int, int) or None
+            Tuple (num_partitions, partition_index) for only reading every num_partitions-th sample
+            starting with sample partition_index (e.g. one partition per Horovod rank).
+            If the number of shards is a multiple of num_partitions,
+            every partition just reads its own subset of the shard files.
+        """
+        self.manifest_filename = manifest_filename
+        self.id_prefix = manifest_filename if id_prefix is None else id_prefix
+        self.reverse = reverse
+        self.shards = []
+        with open_remote(manifest_filename, 'r', encoding='utf-8') as manifest_file:
+            self.manifest = json.load(manifest_file)
+        base_dir = os.path.dirname(manifest_filename)
+        entries = self.manifest[SHARDS_KEY]
+        self.shard_filenames = [os.path.join(base_dir, entry[SHARD_FILENAME_KEY]) for entry in entries]
+        num_shards = len(entries)
+        total_samples = sum(entry[SHARD_SAMPLES_KEY] for entry in entries)
+        for shard_index, entry in enumerate(entries):
+            if entry[SHARD_SAMPLES_KEY] != len(range(shard_index, total_samples, num_shards)):
+                raise RuntimeError('Shard "{}" has unexpected number of samples'.format(entry[SHARD_FILENAME_KEY]))
+        self.num_partitions, self.partition_index = (1, 0) if partition is None else partition
+        self.num_samples = len(range(self.partition_index, total_samples, self.num_partitions))
+
+        def open_shard(shard_filename):
+            return SDB(shard_filename, buffering=buffering, labeled=labeled, memory_map=memory_map)
+        # Only shards that contain samples of the partition get opened
+        global_indices = np.arange(self.partition_index, total_samples, self.num_partitions)
+        shard_indices = global_indices % max(1, num_shards)
+        self.shards = [open_shard(f) if i in shard_indices else None for i, f in enumerate(self.shard_filenames)]
+        self.durations = None
+        if all(shard is None or shard.durations is not None for shard in self.shards):
+            self.durations = np.zeros(self.num_samples, dtype=np.float64)
+            row_indices = global_indices // max(1, num_shards)
+            for shard_index, shard in enumerate(self.shards):
+                if shard is not None:
+                    mask = shard_indices == shard_index
+                    self.durations[mask] = shard.durations[row_indices[mask]]
+            if reverse:
+                self.durations = self.durations[::-1]
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.num_samples:
+            raise ValueError('Wrong sample index: {} - has to be between 0 and {}'.format(i, self.num_samples - 1))
+        global_index = (self.num_samples - 1 - i if self.reverse else i) * self.num_partitions + self.partition_index
+        shard_index = global_index % len(self.shards)
+        sample = self.shards[shard_index][global_index // len(self.shards)]
+        # Global indices identify samples across partitions (and match the IDs assigned by ShardedSDBWriter)
+        sample.sample_id = '{}:{}'.format(self.id_prefix, global_index)
+        return sample
+
+    def __iter__(self):
+        for i in range(self.num_samples):
+            yield self[i]
+
+    def __len__(self):
+        return self.num_samples
+
+    def close(self):
+        for shard in self.shards:
+            if shard is not None:
+                shard.close()
+        self.shards = []
+
+    def __del__(self):
+        self.close()
+
+
 class CSVWriter:  # pylint: disable=too-many-instance-attributes
     """Sample collection writer for writing a CSV data-set and all its referenced WAV samples"""
     def __init__(self,
@@ -487,9 +1021,35 @@ class TarWriter:  # pylint: disable=too-many-instance-attributes
         self.close()
 
 
+class StringColumn:
+    """Compact read-only sequence of strings - stored as one UTF-8 buffer and a NumPy array of offsets into it"""
+    def __init__(self, strings):
+        """
+        Parameters
+        ----------
+        strings : iterable of str or pandas.Series of str
+        """
+        if isinstance(strings, pd.Series):
+            encoded = strings.str.encode('utf-8')
+            lengths = encoded.str.len().to_numpy(dtype=np.int64)
+        else:
+            encoded = [string.encode('utf-8') for string in strings]
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.buffer = b''.join(encoded)
+
+    def __getitem__(self, i):
+        return str(self.buffer[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
 class SampleList:
-    """Sample collection base class with samples loaded from a list of in-memory paths."""
-    def __init__(self, samples, labeled=True, reverse=False):
+    """Sample collection base class with samples loaded from a list of in-memory paths.
+    Paths and transcripts are kept in compact StringColumn instances and ordered through an index array."""
+    def __init__(self, samples, labeled=True, reverse=False, read_ahead=0):
         """
         Parameters
         ----------
@@ -500,23 +1060,43 @@ class SampleList:
             If False: Ignores transcripts (if available) and reads (unlabeled) util.audio.Sample instances.
         reverse : bool
             If the order of the samples should be reversed
+        read_ahead : int
+            If greater than 0: Iterating the collection reads the audio files by a pool of threads
+            that keeps up to read_ahead file reads in flight and yields loaded samples instead of PackedSample
+            instances. Hides latency of remote storage (gs://, hdfs://...).
         """
         self.labeled = labeled
-        self.samples = list(samples)
-        self.samples.sort(key=lambda r: r[1], reverse=reverse)
+        self.read_ahead = read_ahead
+        samples = list(samples)
+        self.set_columns(StringColumn(sample[0] for sample in samples),
+                         np.array([sample[1] for sample in samples], dtype=np.int64),
+                         StringColumn(sample[2] for sample in samples) if labeled else None,
+                         reverse=reverse)
+
+    def set_columns(self, filenames, sizes, transcripts, reverse=False):
+        self.filenames = filenames
+        self.transcripts = transcripts
+        # A stable sort that keeps the original order of equally sized samples - also if reversed
+        self.order = np.argsort(-sizes if reverse else sizes, kind='stable')
 
     def __getitem__(self, i):
-        sample_spec = self.samples[i]
-        return load_sample(sample_spec[0], label=sample_spec[2] if self.labeled else None)
+        row = self.order[i]
+        return load_sample(self.filenames[row], label=self.transcripts[row] if self.labeled else None)
+
+    def __iter__(self):
+        samples = (self[i] for i in range(len(self)))
+        if self.read_ahead > 0:
+            return prefetch(unpack_maybe, samples, self.read_ahead)
+        return samples
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.order)
 
 
 class CSV(SampleList):
     """Sample collection reader for reading a DeepSpeech CSV file
     Automatically orders samples by CSV column wav_filesize (if available)."""
-    def __init__(self, csv_filename, labeled=None, reverse=False):
+    def __init__(self, csv_filename, labeled=None, reverse=False, read_ahead=0):
         """
         Parameters
         ----------
@@ -529,39 +1109,49 @@ class CSV(SampleList):
             (reading util.sample_collections.LabeledSample instances) or not (reading util.audio.Sample instances).
         reverse : bool
             If the order of the samples should be reversed
+        read_ahead : int
+            See SampleList.__init__ .
         """
-        rows = []
         with open_remote(csv_filename, 'r', encoding='utf8') as csv_file:
-            reader = csv.DictReader(csv_file)
-            if 'transcript' in reader.fieldnames:
-                if labeled is None:
-                    labeled = True
-            elif labeled:
-                raise RuntimeError('No transcript data (missing CSV column)')
-            for row in reader:
-                wav_filename = Path(row['wav_filename'])
-                if not wav_filename.is_absolute() and not is_remote_path(row['wav_filename']):
-                    wav_filename = Path(csv_filename).parent / wav_filename
-                    wav_filename = str(wav_filename)
-                else:
-                    # Pathlib otherwise removes a / from filenames like hdfs://
-                    wav_filename = row['wav_filename']
-                wav_filesize = int(row['wav_filesize']) if 'wav_filesize' in row else 0
-                if labeled:
-                    rows.append((wav_filename, wav_filesize, row['transcript']))
-                else:
-                    rows.append((wav_filename, wav_filesize))
-        super(CSV, self).__init__(rows, labeled=labeled, reverse=reverse)
-
-
-def samples_from_source(sample_source, buffering=BUFFER_SIZE, labeled=None, reverse=False):
+            # Parsing all columns as strings (and not as NA values) keeps paths and transcripts unaltered
+            rows = pd.read_csv(csv_file, dtype=str, keep_default_na=False, na_filter=False)
+        if 'transcript' in rows.columns:
+            if labeled is None:
+                labeled = True
+        elif labeled:
+            raise RuntimeError('No transcript data (missing CSV column)')
+        super(CSV, self).__init__([], labeled=labeled, reverse=reverse, read_ahead=read_ahead)
+        wav_filenames = rows['wav_filename']
+        csv_dir = str(Path(csv_filename).parent)
+        if csv_dir != '.':
+            relative = ~(wav_filenames.str.startswith('/') |
+                         wav_filenames.str.startswith('gs://') |
+                         wav_filenames.str.startswith('hdfs://'))
+            wav_filenames = wav_filenames.where(~relative, csv_dir + os.sep + wav_filenames)
+        if 'wav_filesize' in rows.columns:
+            wav_filesizes = rows['wav_filesize'].to_numpy(dtype=np.int64)
+        else:
+            wav_filesizes = np.zeros(len(rows), dtype=np.int64)
+        self.set_columns(StringColumn(wav_filenames),
+                         wav_filesizes,
+                         StringColumn(rows['transcript']) if labeled else None,
+                         reverse=reverse)
+
+
+def samples_from_source(sample_source,
+                        buffering=BUFFER_SIZE,
+                        labeled=None,
+                        reverse=False,
+                        memory_map=False,
+                        partition=None,
+                        read_ahead=0):
     """
     Loads samples from a sample source file.
 
     Parameters
     ----------
     sample_source : str
-        Path to the sample source file (SDB or CSV)
+        Path to the sample source file (SDB, sharded SDB manifest or CSV)
     buffering : int
         Read-buffer size to use while reading files
     labeled : bool or None
@@ -571,20 +1161,41 @@ def samples_from_source(sample_source, buffering=BUFFER_SIZE, labeled=None, reve
         (reading util.sample_collections.LabeledSample instances) or not (reading util.audio.Sample instances).
     reverse : bool
         If the order of the samples should be reversed
+    memory_map : bool
+        If local SDB files should be memory-mapped instead of being read through a buffer
+    partition : tuple of (int, int) or None
+        Only supported for sharded SDB sources - see ShardedSDB.__init__ .
+    read_ahead : int
+        Number of sample files of CSV sources to read ahead (in flight) during iteration - see SampleList.__init__ .
 
     Returns
     -------
     iterable of util.sample_collections.LabeledSample or util.audio.Sample instances supporting len.
     """
     ext = os.path.splitext(sample_source)[1].lower()
+    if ext == SHARDED_SDB_EXTENSION:
+        return ShardedSDB(sample_source,
+                          buffering=buffering,
+                          labeled=labeled,
+                          reverse=reverse,
+                          memory_map=memory_map,
+                          partition=partition)
+    if partition is not None:
+        raise ValueError('Partitioned reading is only supported for sharded SDB sources')
     if ext == '.sdb':
-        return SDB(sample_source, buffering=buffering, labeled=labeled, reverse=reverse)
+        return SDB(sample_source, buffering=buffering, labeled=labeled, reverse=reverse, memory_map=memory_map)
     if ext == '.csv':
-        return CSV(sample_source, labeled=labeled, reverse=reverse)
+        return CSV(sample_source, labeled=labeled, reverse=reverse, read_ahead=read_ahead)
     raise ValueError('Unknown file type: "{}"'.format(ext))
 
 
-def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, reverse=False):
+def samples_from_sources(sample_sources,
+                         buffering=BUFFER_SIZE,
+                         labeled=None,
+                         reverse=False,
+                         memory_map=False,
+                         partition=None,
+                         read_ahead=0):
     """
     Loads and combines samples from a list of source files. Sources are combined in an interleaving way to
     keep default sample order from shortest to longest.
@@ -592,12 +1203,12 @@ def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, re
     Note that when using distributed training, it is much faster to call this function with single pre-
     sorted sample source, because this allows for parallelization of the file I/O. (If this function is
     called with multiple sources, the samples have to be unpacked on a single parent process to allow
-    for reading their durations.)
+    for reading their durations - unless all sources are SDB files with a duration index.)
 
     Parameters
     ----------
     sample_sources : list of str
-        Paths to sample source files (SDBs or CSVs)
+        Paths to sample source files (SDBs, sharded SDB manifests or CSVs)
     buffering : int
         Read-buffer size to use while reading files
     labeled : bool or None
@@ -607,6 +1218,12 @@ def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, re
         util.audio.Sample instances from sources with no transcripts.
     reverse : bool
         If the order of the samples should be reversed
+    memory_map : bool
+        If local SDB files should be memory-mapped instead of being read through a buffer
+    partition : tuple of (int, int) or None
+        Only supported for sharded SDB sources - see ShardedSDB.__init__ .
+    read_ahead : int
+        Number of sample files of CSV sources to read ahead (in flight) during iteration - see SampleList.__init__ .
 
     Returns
     -------
@@ -618,12 +1235,35 @@ def samples_from_sources(sample_sources, buffering=BUFFER_SIZE, labeled=None, re
     if len(sample_sources) == 0:
         raise ValueError('No files')
     if len(sample_sources) == 1:
-        return samples_from_source(sample_sources[0], buffering=buffering, labeled=labeled, reverse=reverse)
+        return samples_from_source(sample_sources[0],
+                                   buffering=buffering,
+                                   labeled=labeled,
+                                   reverse=reverse,
+                                   memory_map=memory_map,
+                                   partition=partition,
+                                   read_ahead=read_ahead)
+
+    collections = [samples_from_source(source,
+                                       buffering=buffering,
+                                       labeled=labeled,
+                                       reverse=reverse,
+                                       memory_map=memory_map,
+                                       partition=partition,
+                                       read_ahead=read_ahead)
+                   for source in sample_sources]
+
+    # If all sources provide a duration index, samples can be interleaved by their (source, row) positions
+    # without reading or unpacking any audio. Samples are then only read while iterating.
+    if all(getattr(collection, 'durations', None) is not None for collection in collections):
+        def get_positions(source_index):
+            collection = collections[source_index]
+            return LenMap(lambda row_index: (collection.durations[row_index], source_index, row_index),
+                          range(len(collection)))
+        positions = Interleaved(*map(get_positions, range(len(collections))), key=lambda p: p[0], reverse=reverse)
+        return LenMap(lambda p: collections[p[1]][p[2]], positions)
 
     # If we wish to interleave based on duration, we have to unpack the audio. Note that this unpacking should
     # be done lazily onn the fly so that it respects the LimitingPool logic used in the feeding code.
-    cols = [LenMap(
-        unpack_maybe, samples_from_source(source, buffering=buffering, labeled=labeled, reverse=reverse))
-        for source in sample_sources]
+    cols = [LenMap(unpack_maybe, collection) for collection in collections]
 
     return Interleaved(*cols, key=lambda s: s.duration, reverse=reverse)
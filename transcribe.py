@@ -15,11 +15,11 @@ import glob
 
 from deepspeech_training.util.audio import AudioFile
 from deepspeech_training.util.config import Config, initialize_globals
-from deepspeech_training.util.feeding import split_audio_file
+from deepspeech_training.util.feeding import split_audio_file, split_audio_files
 from deepspeech_training.util.flags import create_flags, FLAGS
 from deepspeech_training.util.logging import log_error, log_info, log_progress, create_progressbar
 from ds_ctcdecoder import ctc_beam_search_decoder_batch, Scorer
-from multiprocessing import Process, cpu_count
+from multiprocessing import cpu_count
 
 
 def fail(message, code=1):
@@ -64,22 +64,75 @@ def transcribe_file(audio_path, tlog_path):
                                                         scorer=scorer)
                 decoded = list(d[0][1] for d in decoded)
                 transcripts.extend(zip(starts, ends, decoded))
-            transcripts.sort(key=lambda t: t[0])
-            transcripts = [{'start': int(start),
-                            'end': int(end),
-                            'transcript': transcript} for start, end, transcript in transcripts]
-            with open(tlog_path, 'w') as tlog_file:
-                json.dump(transcripts, tlog_file, default=float)
+            write_tlog(tlog_path, transcripts)
 
 
-def transcribe_many(src_paths,dst_paths):
+def write_tlog(tlog_path, transcripts):
+    transcripts = sorted(transcripts, key=lambda t: t[0])
+    transcripts = [{'start': int(start),
+                    'end': int(end),
+                    'transcript': transcript} for start, end, transcript in transcripts]
+    with open(tlog_path, 'w') as tlog_file:
+        json.dump(transcripts, tlog_file, default=float)
+
+
+def transcribe_many(src_paths, dst_paths):
+    from deepspeech_training.train import create_model  # pylint: disable=cyclic-import,import-outside-toplevel
+    from deepspeech_training.util.checkpoints import load_graph_for_evaluation
+    initialize_globals()
+    # Model and scorer get loaded just once and VAD segments of all files are batched together
+    scorer = Scorer(FLAGS.lm_alpha, FLAGS.lm_beta, FLAGS.scorer_path, Config.alphabet)
+    try:
+        num_processes = cpu_count()
+    except NotImplementedError:
+        num_processes = 1
+    # Number of segments per file, known as soon as all segments of the file got fed into the pipeline
+    segment_counts = {}
+    transcripts = {}
+    data_set = split_audio_files(src_paths,
+                                 batch_size=FLAGS.batch_size,
+                                 aggressiveness=FLAGS.vad_aggressiveness,
+                                 outlier_duration_ms=FLAGS.outlier_duration_ms,
+                                 outlier_batch_size=FLAGS.outlier_batch_size,
+                                 file_done_callback=segment_counts.__setitem__)
+    iterator = tf.data.Iterator.from_structure(data_set.output_types, data_set.output_shapes,
+                                               output_classes=data_set.output_classes)
+    batch_file_index, batch_time_start, batch_time_end, batch_x, batch_x_len = iterator.get_next()
+    no_dropout = [None] * 6
+    logits, _ = create_model(batch_x=batch_x, seq_length=batch_x_len, dropout=no_dropout)
+    transposed = tf.nn.softmax(tf.transpose(logits, [1, 0, 2]))
+    tf.train.get_or_create_global_step()
     pbar = create_progressbar(prefix='Transcribing files | ', max_value=len(src_paths)).start()
-    for i in range(len(src_paths)):
-        p = Process(target=transcribe_file, args=(src_paths[i], dst_paths[i]))
-        p.start()
-        p.join()
-        log_progress('Transcribed file {} of {} from "{}" to "{}"'.format(i + 1, len(src_paths), src_paths[i], dst_paths[i]))
-        pbar.update(i)
+    num_done = 0
+
+    def write_finished_tlogs():
+        nonlocal num_done
+        for file_index, num_segments in list(segment_counts.items()):
+            if len(transcripts.get(file_index, [])) < num_segments:
+                continue
+            write_tlog(dst_paths[file_index], transcripts.pop(file_index, []))
+            del segment_counts[file_index]
+            num_done += 1
+            log_progress('Transcribed file {} of {} from "{}" to "{}"'
+                         .format(num_done, len(src_paths), src_paths[file_index], dst_paths[file_index]))
+            pbar.update(num_done)
+
+    with tf.Session(config=Config.session_config) as session:
+        load_graph_for_evaluation(session)
+        session.run(iterator.make_initializer(data_set))
+        while True:
+            try:
+                file_indices, starts, ends, batch_logits, batch_lengths = \
+                    session.run([batch_file_index, batch_time_start, batch_time_end, transposed, batch_x_len])
+            except tf.errors.OutOfRangeError:
+                break
+            decoded = ctc_beam_search_decoder_batch(batch_logits, batch_lengths, Config.alphabet, FLAGS.beam_width,
+                                                    num_processes=num_processes,
+                                                    scorer=scorer)
+            for file_index, start, end, d in zip(file_indices, starts, ends, decoded):
+                transcripts.setdefault(int(file_index), []).append((start, end, d[0][1]))
+            write_finished_tlogs()
+        write_finished_tlogs()
     pbar.finish()
 
 
@@ -118,8 +171,8 @@ def main(_):
                     fail('Destination file(s) from catalog already existing, use --force for overwriting')
                 if any(map(lambda e: not os.path.isdir(os.path.dirname(e[1])), catalog_entries)):
                     fail('Missing destination directory for at least one catalog entry')
-                src_paths,dst_paths = zip(*paths)
-                transcribe_many(src_paths,dst_paths)
+                src_paths, dst_paths = zip(*catalog_entries)
+                transcribe_many(src_paths, dst_paths)
             else:
                 # Transcribe one file
                 dst_path = os.path.abspath(FLAGS.dst) if FLAGS.dst else os.path.splitext(src_path)[0] + '.tlog'